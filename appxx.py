@@ -1,15 +1,9 @@
 import streamlit as st
 from docx import Document
 from docx.shared import Pt
-import os
-import re
-
-# Function to format diagnosis names
-def format_diagnosis_name(diagnosis):
-    diagnosis = diagnosis.replace('_', ' ')
-    formatted_name = re.sub(r'(?<!^)(?=[A-Z])', ' ', diagnosis)
-    formatted_name = formatted_name.title()
-    return formatted_name
+from io import BytesIO
+from diagnosis_catalog import diagnosis_catalog
+from diagnosis_index import diagnosis_index
 
 # Function to create a Word document with specific font settings and single spacing
 def create_word_doc(text):
@@ -24,9 +18,10 @@ def create_word_doc(text):
         p.paragraph_format.space_before = Pt(0)
         #p.paragraph_format.line_spacing = Pt(12)
 
-    output_path = "updated_note.docx"
-    doc.save(output_path)
-    return output_path
+    # Serialize in memory so concurrent sessions never share a file on disk
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
 # Function to combine diagnosis documents with formatted input text
 def combine_notes(assess_text, diagnoses, free_text_diag=None, free_text_plan=None):
@@ -59,8 +54,9 @@ def combine_notes(assess_text, diagnoses, free_text_diag=None, free_text_plan=No
 
     # Add selected diagnoses
     for i, diagnosis in enumerate(diagnoses, start=1):
-        diagnosis_key = diagnosis.lower().replace(' ', '_') + '.docx'
-        if os.path.exists(diagnosis_key):
+        # Compiled once per process; no file access while building the note
+        template = diagnosis_index.get(diagnosis_catalog.key_for(diagnosis))
+        if template is not None:
             diagnosis_paragraph = doc.add_paragraph()
             diagnosis_run = diagnosis_paragraph.add_run(f"{i}). {diagnosis}")
             diagnosis_run.font.size = Pt(9)
@@ -68,8 +64,7 @@ def combine_notes(assess_text, diagnoses, free_text_diag=None, free_text_plan=No
             diagnosis_paragraph.paragraph_format.space_before = Pt(0)
             diagnosis_paragraph.paragraph_format.space_after = Pt(0) 
             
-            diagnosis_doc = Document(diagnosis_key)
-            for para in diagnosis_doc.paragraphs:
+            for para in template:
                 new_paragraph = doc.add_paragraph(para.text)
                 new_paragraph.paragraph_format.space_before = Pt(0)
                 new_paragraph.paragraph_format.space_after = Pt(0)  # No space after diagnosis content
@@ -84,9 +79,14 @@ def combine_notes(assess_text, diagnoses, free_text_diag=None, free_text_plan=No
         doc.add_paragraph(f"Free Text Diagnosis: {free_text_diag}")
         doc.add_paragraph(f"Plan: {free_text_plan}")
 
-    output_path = "combined_note.docx"
-    doc.save(output_path)
-    return output_path
+    # Serialize in memory so concurrent sessions never share a file on disk
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+# Build the diagnosis template index and catalog once per process (later
+# reruns only re-check them)
+diagnosis_catalog.ensure_fresh()
 
 # Title of the app
 st.title("Note Management App")
@@ -97,17 +97,14 @@ st.header("Create a New Note")
 # Input for room number
 room_number = st.text_input("Enter Room Number:")
 
-# Dynamically list available diagnosis documents in the current directory
-available_docs = [f[:-5] for f in os.listdir('.') if f.endswith('.docx')]
-formatted_conditions = [format_diagnosis_name(doc) for doc in available_docs]
-
-# Sort the formatted conditions alphabetically
-sorted_conditions = sorted(formatted_conditions)
-
-# Create a mapping for formatted names to original filenames
-diagnosis_mapping = {format_diagnosis_name(doc): doc for doc in available_docs}
+# Diagnosis names come from the cached catalog; a search narrows the picker
+# to the best matches (already-chosen diagnoses always stay listed)
+diagnosis_query = st.text_input("Search diagnoses:")
+diagnosis_options = diagnosis_catalog.search(diagnosis_query) if diagnosis_query else diagnosis_catalog.names()
+chosen_conditions = st.session_state.get("selected_conditions", [])
+diagnosis_options = chosen_conditions + [name for name in diagnosis_options if name not in chosen_conditions]
 
-selected_conditions = st.multiselect("Choose diagnoses:", sorted_conditions)
+selected_conditions = st.multiselect("Choose diagnoses:", diagnosis_options, key="selected_conditions")
 
 # Input for free text diagnosis and plan
 #free_text_diagnosis = st.text_input("Enter Free Text Diagnosis:")
@@ -119,8 +116,7 @@ if st.button("Submit New Note"):
     if selected_conditions and assessment_text and room_number:
         combined_file = combine_notes(assessment_text, selected_conditions) #free_text_diagnosis,#free_text_plan)
         file_name = f"{room_number}.docx"
-        with open(combined_file, "rb") as f:
-            st.download_button("Download Combined Note", f, file_name=file_name)
+        st.download_button("Download Combined Note", combined_file, file_name=file_name)
     else:
         st.error("Please fill out all fields.")
 
@@ -1,294 +1,34 @@
 import streamlit as st
-from docx import Document
-from docx.shared import Pt
-import os
-import re
-import requests
-from io import BytesIO
+from warmup import record_first_render, warm_up
+import time
+from batch_notes import SERIES_DAYS, normalize_entry, render_series
+from diagnosis_catalog import diagnosis_catalog
+from docx_writer import render_note
+from note_metrics import export_metrics, show_timings_sidebar, start_trace
+from note_builder import NoteParagraph, NoteRun, TemplateSource, build_note
+from prefetch import prefetcher, show_prefetch_sidebar
+from text_writer import render_markdown, render_text
+from template_urls import physical_exam_files, ros_files
+from text_index import text_index, warm_text_index
 
-# Function to format diagnosis names
-def format_diagnosis_name(diagnosis):
-    diagnosis = diagnosis.replace('_', ' ')
-    formatted_name = re.sub(r'(?<!^)(?=[A-Z])', ' ', diagnosis)
-    formatted_name = formatted_name.title()
-    return formatted_name
-
-def fetch_files_from_github(folder_name, fetch_diagnoses=True):
-    url = f"https://api.github.com/repos/conkraw/s_char/contents/{folder_name}"
-    files = []
-    try:
-        # Send GET request to GitHub API to fetch contents of the folder
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            # Parse the response JSON
-            response_files = response.json()
-            for file in response_files:
-                # Filter out only .docx files, adjust for diagnosis folder
-                if file['name'].endswith('.docx') and (fetch_diagnoses or folder_name in ["physicalexam", "ros"]):
-                    files.append(file['name'])
-        else:
-            st.error(f"Failed to fetch files: Status code {response.status_code}")
-            st.write(response.text)  # Display the response content for debugging
-    except requests.exceptions.RequestException as e:
-        st.error(f"An error occurred while fetching files: {e}")
-        st.write(str(e))  # Display the exception details for debugging
-    
-    return files
-
-# Function to download and extract content from a document (for diagnosis fetching)
-def fetch_file_content(folder_name, file_name, fetch_diagnosis=True):
-    url = f"https://raw.githubusercontent.com/conkraw/s_char/master/{folder_name}/{file_name}"
-    
-    try:
-        # If the folder is diagnoses, proceed to fetch it
-        if fetch_diagnosis:
-            response = requests.get(url)
-            if response.status_code == 200:
-                # Save and process the .docx file
-                with open(file_name, "wb") as f:
-                    f.write(response.content)
-                doc = Document(file_name)
-                content = "\n".join([para.text for para in doc.paragraphs])
-                os.remove(file_name)
-                return doc  # Return the Document object, not just plain text
-            else:
-                st.error(f"Failed to fetch content: Status code {response.status_code}")
-                return None
-        else:
-            return None  # Return None for ROS and physical exam files if not needed
-    except requests.exceptions.RequestException as e:
-        st.error(f"An error occurred while fetching content: {e}")
-        return None
-
-def read_docx_from_urlx(url):
-    response = requests.get(url)
-    doc = Document(BytesIO(response.content))
-    content = []
-    for para in doc.paragraphs:
-        content.append(para.text)
-    return '\n'.join(content)
-
-def read_docx_from_url(url):
-    # Ensure the URL starts with https:// or http://
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url  # Default to https if not present
-
-    response = requests.get(url)
-    doc = Document(BytesIO(response.content))
-    return doc  # Return the Document object, not just the text
-    
 # Function to create a Word document with specific font settings and single spacing
 def create_word_doc(text):
-    doc = Document()
-    
-    for line in text.split('\n'):
-        p = doc.add_paragraph()
-        run = p.add_run(line)
-        run.font.name = 'Arial'
-        run.font.size = Pt(9)
-        p.paragraph_format.space_after = Pt(0)
-        p.paragraph_format.space_before = Pt(0)
-    
-    output_path = "updated_note.docx"
-    doc.save(output_path)
-    return output_path
-
-def combine_notes(assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file, free_text_diag=None, free_text_plan=None, critical_care_time=None):
-    doc = Document()
-
-    # Add the introductory statement at the top (italicized, Arial, font size 9)
-    intro_paragraph = doc.add_paragraph()
-    intro_run = intro_paragraph.add_run(
-        "I personally examined the patient separately and discussed the case with the resident/physician assistant and with any services involved in a multidisciplinary fashion. I agree with the resident/physician's assistant documentation with any exceptions noted below:"
-    )
-    intro_run.italic = True
-    intro_run.font.name = 'Arial'
-    intro_run.font.size = Pt(9)
-    intro_paragraph.paragraph_format.space_after = Pt(0)
-    intro_paragraph.paragraph_format.space_before = Pt(0)
-
-    # Add "OVERNIGHT EVENTS:" section
-    overnight_paragraph = doc.add_paragraph()
-    overnight_header_run = overnight_paragraph.add_run("OVERNIGHT EVENTS:")
-    overnight_header_run.bold = True
-    overnight_header_run.underline = True
-    overnight_header_run.font.name = 'Arial'
-    overnight_header_run.font.size = Pt(9)
-    overnight_content_run = overnight_paragraph.add_run(" No acute events were noted overnight.")
-    overnight_content_run.font.name = 'Arial'
-    overnight_content_run.font.size = Pt(9)
-    overnight_paragraph.paragraph_format.space_after = Pt(6)
-    overnight_paragraph.paragraph_format.space_before = Pt(6)
-
-    # Add "SUBJECTIVE" header and ROS content
-    if ros_file != "None.docx":
-        ros_paragraph = doc.add_paragraph()
-        
-        # Add SUBJECTIVE heading (bold, underline)
-        ros_run = ros_paragraph.add_run("SUBJECTIVE: ")
-        ros_run.bold = True
-        ros_run.underline = True
-        ros_run.font.name = 'Arial'
-        ros_run.font.size = Pt(9)
-
-        ros_paragraph.paragraph_format.space_after = Pt(0)
-        ros_paragraph.paragraph_format.space_before = Pt(0)
-        
-        # Fetch the content of the selected ROS file
-        ros_doc = read_docx_from_url(ros_url)
-
-        if ros_doc:
-            for para in ros_doc.paragraphs:
-                new_paragraph = doc.add_paragraph()
-
-                # Split the paragraph text by the target phrases and apply formatting to those specific phrases
-                text = para.text
-                text_chunks = []
-
-                # Check and split for "OVERNIGHT EVENTS"
-                if "OVERNIGHT EVENTS" in text:
-                    text_chunks.extend(text.split("OVERNIGHT EVENTS"))
-                    text_chunks.insert(1, "OVERNIGHT EVENTS")
-                else:
-                    text_chunks.append(text)
-
-                # Now handle applying bold/underline to "OVERNIGHT EVENTS" and "SUBJECTIVE"
-                formatted_text = []
-                for chunk in text_chunks:
-                    if chunk == "OVERNIGHT EVENTS":
-                        # Apply bold and underline only to "OVERNIGHT EVENTS"
-                        run = new_paragraph.add_run(chunk)
-                        run.bold = True
-                        run.underline = True
-                    elif "SUBJECTIVE" in chunk:
-                        # Apply bold and underline to "SUBJECTIVE"
-                        run = new_paragraph.add_run(chunk)
-                        run.bold = True
-                        run.underline = True
-                    else:
-                        # For normal text, just add as-is
-                        run = new_paragraph.add_run(chunk)
-                    run.font.name = 'Arial'
-                    run.font.size = Pt(9)
-
-                new_paragraph.paragraph_format.space_after = Pt(6)
-                new_paragraph.paragraph_format.space_before = Pt(0)
-
-    # Add Objective section if a physical exam day is selected
-    if physical_exam_day:
-        objective_paragraph = doc.add_paragraph()
-        objective_run = objective_paragraph.add_run("OBJECTIVE:")
-        objective_run.bold = True
-        objective_run.underline = True
-        objective_run.font.name = 'Arial'
-        objective_run.font.size = Pt(9)
-        objective_paragraph.paragraph_format.space_after = Pt(0)
-        objective_paragraph.paragraph_format.space_before = Pt(0)
-
-        # Fetch the content of the selected physical exam day
-        physical_exam_doc = read_docx_from_url(physical_exam_url)
-
-        # Add the fetched content under the OBJECTIVE section
-        if physical_exam_doc:
-            for para in physical_exam_doc.paragraphs:
-                new_paragraph = doc.add_paragraph(para.text)
-                new_paragraph.paragraph_format.space_after = Pt(0)
-                new_paragraph.paragraph_format.space_before = Pt(0)
-                for run in new_paragraph.runs:
-                    run.font.name = 'Arial'
-                    run.font.size = Pt(9)
-
-    # Add Assessment section
-    assessment_paragraph = doc.add_paragraph()
-    assessment_run = assessment_paragraph.add_run("ASSESSMENT:")
-    assessment_run.bold = True
-    assessment_run.underline = True
-    assessment_run.font.name = 'Arial'
-    assessment_run.font.size = Pt(9)
-    assessment_paragraph.paragraph_format.space_after = Pt(0)
-    assessment_paragraph.paragraph_format.space_before = Pt(6)
+    # One Arial 9 paragraph per line, rendered by the shared note writer
+    paragraphs = [NoteParagraph((NoteRun(line),), 0, 0) for line in text.split('\n')]
+    return render_note(paragraphs)
 
-    assessment_content = doc.add_paragraph(assess_text)
-    for run in assessment_content.runs:
-        run.font.name = 'Arial'
-        run.font.size = Pt(9)
 
-    # Add the "Why Critical Care" dropdown selection after assessment only if it's not empty
-    if critical_care_reason != "":
-        critical_care_paragraph = doc.add_paragraph()
-        critical_care_run = critical_care_paragraph.add_run("CLINICAL INDICATIONS FOR CRITICAL CARE SERVICES:")
-        critical_care_run.bold = True
-        critical_care_run.underline = True
-        critical_care_run.font.name = 'Arial'
-        critical_care_run.font.size = Pt(9)
-        critical_care_paragraph.paragraph_format.space_after = Pt(0)
-        critical_care_paragraph.paragraph_format.space_before = Pt(0)
+# Time the whole rerun; the stages inside it are recorded by note_metrics.span
+rerun_trace = start_trace("rerun")
+show_timings = st.sidebar.checkbox("Show timings")
+show_memory = st.sidebar.checkbox("Show memory")
+prefetch_templates = st.sidebar.checkbox("Prefetch likely templates", value=prefetcher.enabled, disabled=not prefetcher.enabled)
 
-        critical_care_content = doc.add_paragraph(critical_care_reason)
-        for run in critical_care_content.runs:
-            run.font.name = 'Arial'
-            run.font.size = Pt(9)
-
-    # Plan section
-    plan_paragraph = doc.add_paragraph()
-    plan_run = plan_paragraph.add_run("PLAN:")
-    plan_run.bold = True
-    plan_run.underline = True
-    plan_run.font.name = 'Arial'
-    plan_run.font.size = Pt(9)
-    plan_paragraph.paragraph_format.space_after = Pt(0)
-    plan_paragraph.paragraph_format.space_before = Pt(0)
-
-    # Add selected diagnoses
-    for i, diagnosis in enumerate(diagnoses, start=1):
-        diagnosis_key = diagnosis.lower().replace(' ', '_') + '.docx'
-        if os.path.exists(diagnosis_key):
-            diagnosis_paragraph = doc.add_paragraph()
-            diagnosis_run = diagnosis_paragraph.add_run(f"{i}). {diagnosis}")
-            diagnosis_run.font.size = Pt(9)
-            diagnosis_run.font.name = 'Arial'
-            diagnosis_paragraph.paragraph_format.space_before = Pt(0)
-            diagnosis_paragraph.paragraph_format.space_after = Pt(0)
-
-            diagnosis_doc = Document(diagnosis_key)
-            for para in diagnosis_doc.paragraphs:
-                new_paragraph = doc.add_paragraph(para.text)
-                new_paragraph.paragraph_format.space_before = Pt(0)
-                new_paragraph.paragraph_format.space_after = Pt(0)
-
-                for run in new_paragraph.runs:
-                    run.font.name = 'Arial'
-                    run.font.size = Pt(9)
-
-    # Append free-text diagnosis and plan if provided
-    if free_text_diag and free_text_plan:
-        doc.add_paragraph()  # Add a blank line
-        doc.add_paragraph(f"Free Text Diagnosis: {free_text_diag}")
-        doc.add_paragraph(f"Plan: {free_text_plan}")
-
-    # Append Critical Care Time if provided
-    if critical_care_time:
-        plan_paragraph = doc.add_paragraph()
-    
-        # Add the bolded "Critical Care Time: " part
-        plan_run = plan_paragraph.add_run("Critical Care Time: ")
-        plan_run.bold = True
-        plan_run.font.name = 'Arial'
-        plan_run.font.size = Pt(9)
-    
-        # Add the non-bolded critical care time value
-        plan_run = plan_paragraph.add_run(f"{critical_care_time}")
-        plan_run.bold = False  # Remove bold formatting
-        plan_run.font.name = 'Arial'
-        plan_run.font.size = Pt(9)
-    
-        plan_paragraph.paragraph_format.space_before = Pt(6)
-        plan_paragraph.paragraph_format.space_after = Pt(6)
-    
-    output_path = "combined_note.docx"
-    doc.save(output_path)
-    return output_path
+# Warm the process once (catalog now, templates in the background); later
+# reruns only re-check the catalog
+warm_up()
+diagnosis_catalog.ensure_fresh()
+warm_text_index()
 
 # Title of the app
 st.title("Note Management App")
@@ -296,58 +36,28 @@ st.title("Note Management App")
 # Header for the New Note section
 st.header("Create a New Note")
 
+# Full-text search over every diagnosis, ROS and physical exam template
+with st.expander("Search template text"):
+    text_query = st.text_input("Find templates containing:")
+    if text_query:
+        search_start = time.perf_counter()
+        hits = text_index.search(text_query)
+        st.caption(f"{len(hits)} templates in {(time.perf_counter() - search_start) * 1000:.1f} ms")
+        for hit in hits:
+            kind, name, _ = hit.doc_id
+            st.markdown(f"**{kind}: {name}**")
+            for snippet in hit.snippets:
+                st.markdown(f"> {snippet}")
+
 # Input for room number
 room_number = st.text_input("Enter Room Number:")
 
-ros_files = {
-    "None": "https://raw.githubusercontent.com/conkraw/s_char/main/ros/None.docx",
-    "ROS_PARENT": "https://raw.githubusercontent.com/conkraw/s_char/main/ros/ros_parent.docx",
-    "ROS_RN": "https://raw.githubusercontent.com/conkraw/s_char/main/ros/ros_rn.docx"
-}
-
-physical_exam_files = {
-    "Adolescent Day 0": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day0.docx",
-    "Infant Day 0": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day0.docx",
-    "Child Day 0": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day0.docx",
-    "Chronic Day 0": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day0.docx",
-    
-    "Adolescent Day 1": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day1.docx",
-    "Infant Day 1": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day1.docx",
-    "Child Day 1": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day1.docx",
-    "Chronic Day 1": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day1.docx",
-    
-    "Adolescent Day 2": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day2.docx",
-    "Infant Day 2": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day2.docx",
-    "Child Day 2": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day2.docx",
-    "Chronic Day 2": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day2.docx",
-    
-    "Adolescent Day 3": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day3.docx",
-    "Infant Day 3": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day3.docx",
-    "Child Day 3": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day3.docx",
-    "Chronic Day 3": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day3.docx",
-    
-    "Adolescent Day 4": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day4.docx",
-    "Infant Day 4": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day4.docx",
-    "Child Day 4": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day4.docx",
-    "Chronic Day 4": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day4.docx",
-    
-    "Adolescent Day 5": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day5.docx",
-    "Infant Day 5": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day5.docx",
-    "Child Day 5": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day5.docx",
-    "Chronic Day 5": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day5.docx",
-    
-    "Adolescent Day 6": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Adolescent_Physical_Exam_Day6.docx",
-    "Infant Day 6": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Infant_Physical_Exam_Day6.docx",
-    "Child Day 6": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Child_Physical_Exam_Day6.docx",
-    "Chronic Day 6": "https://raw.githubusercontent.com/conkraw/s_char/main/physicalexam/Chronic_Physical_Exam_Day6.docx",
-}
-
-
-# Dynamically list available diagnosis documents in the current directory
-available_docs = [f[:-5] for f in os.listdir('.') if f.endswith('.docx')]
-formatted_conditions = [format_diagnosis_name(doc) for doc in available_docs]
-
-sorted_conditions = sorted(formatted_conditions)
+# Diagnosis names come from the cached catalog; a search narrows the picker
+# to the best matches (already-chosen diagnoses always stay listed)
+diagnosis_query = st.text_input("Search diagnoses:")
+diagnosis_options = diagnosis_catalog.search(diagnosis_query) if diagnosis_query else diagnosis_catalog.names()
+chosen_conditions = st.session_state.get("selected_conditions", [])
+diagnosis_options = chosen_conditions + [name for name in diagnosis_options if name not in chosen_conditions]
 
 # Dropdowns for selecting ROS and Physical Exam files
 ros_selection = st.selectbox("Select ROS file:", list(ros_files.keys()))
@@ -357,11 +67,12 @@ physical_exam_selection = st.selectbox("Select Physical Exam file:", list(physic
 ros_url = ros_files[ros_selection]
 physical_exam_url = physical_exam_files[physical_exam_selection]
 
-ros_text = read_docx_from_url(ros_url)  # Fetch the content of ROS file
-physical_exam_text = read_docx_from_url(physical_exam_url)  # Fetch the content of Physical Exam file
+# Nothing is downloaded here; the templates are fetched when a note is submitted
+ros_source = TemplateSource(ros_url)
+physical_exam_source = TemplateSource(physical_exam_url)
 
 # Select diagnoses
-selected_conditions = st.multiselect("Choose diagnoses:", sorted_conditions)
+selected_conditions = st.multiselect("Choose diagnoses:", diagnosis_options, key="selected_conditions")
 
 assessment_text = st.text_area("Enter Assessment:")
 
@@ -398,19 +109,76 @@ selected_critical_care = st.selectbox("Why Critical Care:", critical_care_option
 # Add the Critical Care Time input (optional)
 critical_care_time = st.text_input("Enter Critical Care Time (optional):")
 
-if st.button("Submit New Note"):
+# Series mode: a note for every day (Day 0 - Day 6) of the selected age group's
+# physical exams; a day's assessment can differ from the one above
+with st.expander("Day 0 - Day 6 series"):
+    series_assessments = {
+        day: st.text_area(f"Day {day} assessment (blank: same as above):", key=f"series_assessment_{day}")
+        for day in SERIES_DAYS
+    }
+
+# Format of the copyable text shown next to the .docx download
+text_format = st.radio("Copyable note text:", ["Plain text", "Markdown"], horizontal=True)
+
+submit_note = st.button("Submit New Note")
+if submit_note:
     if selected_conditions and assessment_text and room_number:
-        combined_file = combine_notes(
+        if prefetch_templates:
+            prefetcher.record_use(ros_selection, physical_exam_selection, selected_conditions)
+        # Build the note once, then render it as text (shown right away) and as .docx
+        note_paragraphs = build_note(
             assessment_text,
             selected_critical_care,
             selected_conditions,
-            physical_exam_day=physical_exam_text, 
-            ros_file=ros_text,
+            physical_exam_day=physical_exam_source,
+            ros_file=ros_source,
             critical_care_time=critical_care_time
         )
+        if text_format == "Markdown":
+            st.code(render_markdown(note_paragraphs), language="markdown", wrap_lines=True)
+        else:
+            st.code(render_text(note_paragraphs), language=None, wrap_lines=True)
+        combined_file = render_note(note_paragraphs)
         file_name = f"{room_number}.docx"
-        with open(combined_file, "rb") as f:
-            st.download_button("Download Combined Note", f, file_name=file_name)
+        st.download_button("Download Combined Note", combined_file, file_name=file_name)
+    else:
+        st.error("Please fill out all fields.")
+
+submit_series = st.button("Submit Day 0 - Day 6 Series")
+if submit_series:
+    if selected_conditions and assessment_text and room_number:
+        series_zip, failures = render_series(
+            normalize_entry({
+                "room": room_number,
+                "diagnoses": selected_conditions,
+                "assessment": assessment_text,
+                "ros": ros_selection,
+                "physical_exam": physical_exam_selection,
+                "critical_care_reason": selected_critical_care,
+                "critical_care_time": critical_care_time,
+            }),
+            overrides={day: {"assessment": text} for day, text in series_assessments.items() if text.strip()},
+        )
+        for room, error in failures:
+            st.error(f"{room}: {error}")
+        st.download_button("Download Note Series", series_zip, file_name=f"{room_number}_series.zip")
     else:
         st.error("Please fill out all fields.")
 
+
+# While the form is being filled in, warm what this note (and likely the
+# next one) needs on the prefetch threads; this only queues work. A submit
+# rerun loads its templates itself, so nothing is queued alongside it.
+if prefetch_templates and not (submit_note or submit_series):
+    prefetcher.prefetch(ros_selection, physical_exam_selection, selected_conditions)
+
+# Record this rerun, export the metrics and show the timing panel if asked
+rerun_trace.finish()
+record_first_render(rerun_trace)
+export_metrics()
+if show_timings:
+    show_timings_sidebar(st, rerun_trace)
+    show_prefetch_sidebar(st)
+if show_memory:
+    from memory_report import show_memory_sidebar
+    show_memory_sidebar(st)
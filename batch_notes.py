@@ -0,0 +1,301 @@
+# Headless batch mode: generate the notes for a whole unit census at once.
+#
+#     python batch_notes.py census.csv -o notes.zip [--workers 4] [--local-templates]
+#
+# The census is a CSV or JSON file with one entry per room:
+#
+#   room                    room number, used for the {room}.docx file name
+#   diagnoses               list (JSON) or ";"-separated names (CSV), as shown in the app
+#   assessment              assessment text
+#   ros                     "None", "ROS_PARENT" or "ROS_RN"
+#   physical_exam           e.g. "Infant Day 2"; or give exam_age + exam_day instead
+#   critical_care_reason    optional
+#   critical_care_time      optional
+#   days                    optional (JSON, with --series): per-day overrides,
+#                           e.g. {"3": {"assessment": "..."}, "5": {"ros": "None"}};
+#                           in a CSV, the same JSON object as the cell text
+#
+# With --series each entry becomes a Day 0 - Day 6 series of notes for its
+# age group's physical exams, written as {room}_Day{n}.docx.
+#
+# Notes are rendered with combine_notes on a process pool. Each worker loads
+# the diagnosis index and the ROS / physical exam templates once, and a
+# failing note is reported without stopping the rest of the batch; a note
+# naming a diagnosis that has no template fails rather than leaving that
+# plan out.
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from diagnosis_catalog import diagnosis_catalog
+from diagnosis_index import diagnosis_index
+from note_builder import TemplateSource, combine_notes
+from template_cache import get_docx, load_template, warm_templates
+from template_urls import physical_exam_files, physical_exam_paths, ros_files, ros_paths
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The days of a note series (the physical exam templates go Day0 - Day6),
+# and the fields a per-day override may change
+SERIES_DAYS = tuple(range(7))
+SERIES_FIELDS = ("diagnoses", "assessment", "ros", "critical_care_reason", "critical_care_time")
+
+# Set in each worker by init_worker
+_loader = get_docx
+
+
+# Function to read a census file (CSV or JSON) into a list of dicts
+def read_census(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = entries.get("patients", [])
+        else:
+            entries = list(csv.DictReader(f))
+    normalized = []
+    for number, entry in enumerate(entries, start=1):
+        try:
+            normalized.append(normalize_entry(entry))
+        except ValueError as e:
+            raise ValueError(f"{path}: entry {number}: {e}") from None
+    return normalized
+
+
+# Function to fill in defaults and turn CSV strings into the values combine_notes expects
+def normalize_entry(entry):
+    diagnoses = entry.get("diagnoses") or []
+    if isinstance(diagnoses, str):
+        diagnoses = [name.strip() for name in diagnoses.split(';') if name.strip()]
+
+    physical_exam = str(entry.get("physical_exam") or "").strip()
+    if not physical_exam and entry.get("exam_age"):
+        physical_exam = f"{str(entry['exam_age']).strip().title()} Day {str(entry.get('exam_day', 0)).strip()}"
+
+    return {
+        "room": str(entry.get("room", "")).strip(),
+        "diagnoses": diagnoses,
+        "assessment": entry.get("assessment") or "",
+        "ros": str(entry.get("ros") or "None").strip(),
+        "physical_exam": physical_exam,
+        "critical_care_reason": entry.get("critical_care_reason") or "",
+        "critical_care_time": str(entry.get("critical_care_time") or ""),
+        "days": parse_days(entry.get("days")),
+    }
+
+
+# Function to read the per-day overrides of a series entry: a {day: {field:
+# value}} mapping, or the same as JSON text (a CSV cell). Raises ValueError
+# for anything else.
+def parse_days(days):
+    if isinstance(days, str):
+        if not days.strip():
+            return {}
+        try:
+            days = json.loads(days)
+        except ValueError as e:
+            raise ValueError(f"days is not valid JSON: {e}") from None
+    if not days:
+        return {}
+    if not isinstance(days, dict):
+        raise ValueError('days must be a JSON object like {"3": {"assessment": "..."}}')
+    for day, fields in days.items():
+        if not str(day).strip().isdigit():
+            raise ValueError(f"days: {day!r} is not a day number")
+        if not isinstance(fields, dict):
+            raise ValueError(f"days: the overrides for day {day} must be an object of field values")
+    return days
+
+
+# Function to load (once per process) a template from the repo checkout instead of GitHub
+@lru_cache(maxsize=None)
+def load_local_template(path):
+    with open(os.path.join(ROOT, path), "rb") as f:
+        return load_template(f.read())
+
+
+def init_worker(local_templates, template_keys):
+    global _loader
+    _loader = load_local_template if local_templates else get_docx
+    # Warm the per-process caches once so every note in this worker shares them
+    diagnosis_index.ensure_fresh()
+    for key in template_keys:
+        try:
+            _loader(key)
+        except Exception:
+            pass  # the notes that need it will report the error
+
+
+# Function to resolve the ROS / physical exam selection of one census entry
+def _template_keys(entry, local_templates):
+    if entry["ros"] not in ros_paths:
+        raise ValueError(f"unknown ROS selection {entry['ros']!r}")
+    if entry["physical_exam"] not in physical_exam_paths:
+        raise ValueError(f"unknown physical exam selection {entry['physical_exam']!r}")
+    if local_templates:
+        return ros_paths[entry["ros"]], physical_exam_paths[entry["physical_exam"]]
+    return ros_files[entry["ros"]], physical_exam_files[entry["physical_exam"]]
+
+
+# Function to expand one patient entry into a note per day: the physical
+# exam follows the day within the entry's age group, the room gets a
+# _Day{n} suffix, and `overrides` ({day: {field: value}}, default: the
+# entry's "days") changes individual days
+def series_entries(entry, overrides=None, days=SERIES_DAYS):
+    overrides = parse_days(entry.get("days") if overrides is None else overrides)
+    overrides = {int(day): fields for day, fields in overrides.items()}
+    age = entry["physical_exam"].rsplit(" Day ", 1)[0]
+    expanded = []
+    for day in days:
+        fields = {field: value for field, value in overrides.get(day, {}).items() if field in SERIES_FIELDS}
+        day_entry = normalize_entry(dict(entry, physical_exam=f"{age} Day {day}", days={}, **fields))
+        if day_entry["room"]:
+            day_entry["room"] = f"{day_entry['room']}_Day{day}"
+        expanded.append(day_entry)
+    return expanded
+
+
+# Function to render one patient's whole series in this process and zip it.
+# Every template the series needs is fetched up front in parallel, and the
+# days share one TemplateSource per template, so the ROS, header and
+# diagnosis sections are loaded and rendered once for all seven notes.
+# Returns (zip bytes, [(room, error), ...]).
+def render_series(entry, overrides=None, days=SERIES_DAYS, local_templates=False):
+    day_entries = series_entries(entry, overrides, days)
+    loader = load_local_template if local_templates else get_docx
+    keys = set()
+    for day_entry in day_entries:
+        try:
+            keys.update(_template_keys(day_entry, local_templates))
+        except ValueError:
+            pass  # reported per note by render_entry
+    if not local_templates:
+        warm_templates(keys)
+    sources = {key: TemplateSource(key, loader) for key in keys}
+
+    failures = []
+    used = set()
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for day_entry in day_entries:
+            room, data, error = render_entry(day_entry, local_templates, sources)
+            if error is not None:
+                failures.append((room, error))
+                continue
+            archive.writestr(note_file_name(room, used), data)
+        if failures:
+            archive.writestr("errors.txt", "".join(f"{room or '?'}: {error}\n" for room, error in failures))
+    return buffer.getvalue(), failures
+
+
+# Function to check that a normalized entry can be rendered, returning its
+# (ROS, physical exam) template keys; raises ValueError otherwise. Every
+# diagnosis must have a template: one that did not would silently leave
+# its plan out of the note.
+def validate_entry(entry, local_templates=False):
+    for field in ("room", "assessment", "critical_care_reason", "critical_care_time"):
+        if not isinstance(entry[field], str):
+            raise ValueError(f"{field} must be a string")
+    diagnoses = entry["diagnoses"]
+    if not isinstance(diagnoses, list) or not all(isinstance(name, str) for name in diagnoses):
+        raise ValueError("diagnoses must be a list of names")
+    if not entry["room"]:
+        raise ValueError("missing room")
+    if not diagnoses or not entry["assessment"]:
+        raise ValueError("diagnoses and assessment are required")
+    unknown = [name for name in diagnoses if diagnosis_index.get(diagnosis_catalog.key_for(name)) is None]
+    if unknown:
+        raise ValueError(f"unknown diagnoses: {', '.join(unknown)}")
+    return _template_keys(entry, local_templates)
+
+
+# Function run in a worker: render one note, returning (room, bytes, error).
+# `sources` ({template key: TemplateSource}) lets several notes share loads.
+def render_entry(entry, local_templates=False, sources=None):
+    try:
+        ros_key, exam_key = validate_entry(entry, local_templates)
+        sources = sources or {}
+        data = combine_notes(
+            entry["assessment"],
+            entry["critical_care_reason"],
+            entry["diagnoses"],
+            physical_exam_day=sources.get(exam_key) or TemplateSource(exam_key, _loader),
+            ros_file=sources.get(ros_key) or TemplateSource(ros_key, _loader),
+            critical_care_time=entry["critical_care_time"],
+        )
+        return entry["room"], data, None
+    except Exception as e:  # one bad entry must not abort the batch
+        return entry.get("room", ""), None, f"{type(e).__name__}: {e}"
+
+
+# Function to turn a room number into a safe, unique file name inside the zip
+def note_file_name(room, used):
+    base = re.sub(r'[^A-Za-z0-9._-]+', '_', room) or "room"
+    name = f"{base}.docx"
+    n = 2
+    while name in used:
+        name = f"{base}_{n}.docx"
+        n += 1
+    used.add(name)
+    return name
+
+
+# Function to render every census entry and write one zip of {room}.docx files.
+# Returns the list of (room, error) failures.
+def run_batch(entries, output_path, workers=None, local_templates=False):
+    template_keys = set()
+    for entry in entries:
+        try:
+            template_keys.update(_template_keys(entry, local_templates))
+        except ValueError:
+            pass  # reported per note by render_entry
+
+    failures = []
+    used = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(local_templates, sorted(template_keys))) as pool:
+        results = pool.map(render_entry, entries, [local_templates] * len(entries))
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for room, data, error in results:
+                if error is not None:
+                    failures.append((room, error))
+                    continue
+                archive.writestr(note_file_name(room, used), data)
+            if failures:
+                archive.writestr("errors.txt", "".join(f"{room or '?'}: {error}\n" for room, error in failures))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate notes for a whole census in one run.")
+    parser.add_argument("census", help="CSV or JSON census file")
+    parser.add_argument("-o", "--output", default="notes.zip", help="zip file to write (default: notes.zip)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--local-templates", action="store_true",
+                        help="read ROS / physical exam templates from this checkout instead of GitHub")
+    parser.add_argument("--series", action="store_true",
+                        help="write a Day 0 - Day 6 series of notes for every entry")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = read_census(args.census)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.series:
+        entries = [day_entry for entry in entries for day_entry in series_entries(entry)]
+    failures = run_batch(entries, args.output, args.workers, args.local_templates)
+    print(f"Wrote {len(entries) - len(failures)} of {len(entries)} notes to {args.output}")
+    for room, error in failures:
+        print(f"  failed {room or '?'}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
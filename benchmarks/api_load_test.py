@@ -0,0 +1,168 @@
+# Load test of the note API (note_server.py) on one box.
+#
+#     python benchmarks/api_load_test.py [--clients 1,4,16,64] [--requests 20]
+#                                        [--workers 4] [--queue 32]
+#                                        [--latency 0.02] [--url URL] [-o api.json]
+#
+# Starts the server in this process on a free port, its worker pool warmed
+# against the local GitHub stand-in (fake_github.py), unless --url points
+# at one already running. For every client count, that many clients each
+# POST --requests note specs back to back (a rejected request is not
+# retried), and the report gives latency percentiles of the served notes,
+# throughput, and how many requests were turned away (503), timed out
+# (504) or failed, so it shows where the pool saturates and backpressure
+# starts.
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_github import FakeGitHub  # noqa: E402
+from load_test import ASSESSMENTS, percentiles  # noqa: E402
+
+
+# Function to make the note spec a client sends
+def note_spec(rng, diagnoses, exams):
+    return {
+        "room": str(rng.randint(1, 40)),
+        "diagnoses": rng.sample(diagnoses, 5),
+        "assessment": rng.choice(ASSESSMENTS),
+        "ros": rng.choice(["ROS_RN", "ROS_PARENT"]),
+        "physical_exam": rng.choice(exams),
+        "critical_care_time": "35 minutes",
+    }
+
+
+# One client: a keep-alive connection sending `requests` notes in a row
+def _client(address, number, requests, diagnoses, exams, latencies, statuses, lock):
+    rng = random.Random(number)
+    connection = http.client.HTTPConnection(*address, timeout=120)
+    for _ in range(requests):
+        body = json.dumps(note_spec(rng, diagnoses, exams))
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/notes", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(*address, timeout=120)
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(elapsed)
+    connection.close()
+
+
+# Function to run `clients` clients at once and report
+def run_level(address, clients, requests, diagnoses, exams):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=_client, args=(address, number, requests, diagnoses, exams, latencies, statuses, lock))
+        for number in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = sum(statuses.values())
+    return {
+        "clients": clients,
+        "seconds": elapsed,
+        "notes": statuses[200],
+        "notes_per_second": statuses[200] / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "rejected": statuses[503],
+        "timed_out": statuses[504],
+        "failed": total - statuses[200] - statuses[503] - statuses[504],
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+
+
+# Function to print one report line per client count
+def print_level(result, out=sys.stdout):
+    latency = result["latency"] or {}
+    out.write(
+        f"{result['clients']:4d} clients  {result['notes_per_second']:7.1f} notes/s  "
+        f"p50 {latency.get('p50_ms', 0):7.1f} p90 {latency.get('p90_ms', 0):7.1f} p99 {latency.get('p99_ms', 0):7.1f} ms  "
+        f"rejected {result['rejected']}  timed out {result['timed_out']}  failed {result['failed']}\n"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the note API with concurrent clients.")
+    parser.add_argument("--clients", default="1,4,16,64", help="comma-separated concurrent client counts")
+    parser.add_argument("--requests", type=int, default=20, help="notes each client requests")
+    parser.add_argument("--workers", type=int, default=None, help="server worker processes (default: the server's)")
+    parser.add_argument("--queue", type=int, default=None, help="requests allowed to wait (default: the server's)")
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in server latency per request (s)")
+    parser.add_argument("--url", default=None, help="test a server already running here instead")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here")
+    args = parser.parse_args(argv)
+    levels = [int(n) for n in args.clients.split(",") if n.strip()]
+
+    with FakeGitHub(latency=args.latency) as github, tempfile.TemporaryDirectory() as cache_dir:
+        github.install_env()
+        os.environ["S_CHAR_CACHE_DIR"] = cache_dir
+        # Imported only now, so the template URLs point at the stand-in
+        import note_server
+        from diagnosis_catalog import diagnosis_catalog
+        from template_urls import physical_exam_files
+
+        service = server = None
+        if args.url:
+            parts = urlsplit(args.url)
+            address = (parts.hostname, parts.port or 80)
+        else:
+            service = note_server.NoteService(
+                args.workers or note_server.DEFAULT_WORKERS,
+                note_server.DEFAULT_QUEUE if args.queue is None else args.queue,
+            )
+            start = time.perf_counter()
+            service.warm_up()
+            print(f"{service.workers} workers warm in {time.perf_counter() - start:.1f} s, queue {service.queue}")
+            server = note_server.make_server(service, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            address = server.server_address[:2]
+
+        diagnoses = diagnosis_catalog.names()
+        exams = list(physical_exam_files)
+        results = []
+        try:
+            for clients in levels:
+                result = run_level(address, clients, args.requests, diagnoses, exams)
+                results.append(result)
+                print_level(result)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                service.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"latency_s": args.latency, "requests_per_client": args.requests, "levels": results}, f, indent=2)
+    return 1 if any(result["failed"] or result["timed_out"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# Before/after benchmark for the note writers in docx_writer.py.
+#
+#     python benchmarks/bench_writer.py [iterations]
+#
+# Builds the same note (ROS, physical exam, 10 diagnoses) with each writer,
+# .docx and text, and reports time per note and output size. Templates are read from the
+# repo checkout, so no network access is needed.
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from docx import Document  # noqa: E402
+
+from diagnosis_index import diagnosis_index  # noqa: E402
+from docx_writer import WRITERS  # noqa: E402
+from note_builder import build_note  # noqa: E402
+from text_writer import render_markdown, render_text  # noqa: E402
+
+DIAGNOSES = [
+    "Sepsis", "Anemia", "Asthma", "Hypokalemia", "Pain Control",
+    "Constipation", "Epilepsy", "Hyponatremia", "Insomnia", "Thrombocytopenia",
+]
+
+
+def main(iterations=50):
+    diagnosis_index.ensure_fresh()
+    ros_doc = Document(os.path.join(ROOT, "ros", "ros_rn.docx"))
+    exam_doc = Document(os.path.join(ROOT, "physicalexam", "Child_Physical_Exam_Day2.docx"))
+    paragraphs = build_note(
+        "Assessment text.", "Critical care reason.", DIAGNOSES, exam_doc, ros_doc,
+        critical_care_time="35 minutes",
+    )
+
+    results = {}
+    writers = dict(WRITERS, text=render_text, markdown=render_markdown)
+    for name, render in writers.items():
+        render(paragraphs)  # warm up (the fast writer builds its base package once)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            data = render(paragraphs)
+        elapsed = (time.perf_counter() - start) / iterations
+        results[name] = elapsed
+        print(f"{name:12s} {elapsed * 1000:8.2f} ms/note  {len(data) / 1024:7.1f} KB")
+
+    print(f"speed-up: {results['python-docx'] / results['fast']:.1f}x (fast), {results['python-docx'] / results['text']:.1f}x (text)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
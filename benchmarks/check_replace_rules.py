@@ -0,0 +1,50 @@
+# Checks of the single-pass rule set against rules written as separate
+# regular expressions.
+#
+#     python benchmarks/check_replace_rules.py
+#
+# Every case is a rule list, a text and the expected result (or the
+# ValueError the rule set must raise instead of a raw re.error). Exits
+# non-zero on any difference.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replace_rules import Rule, RuleSet  # noqa: E402
+
+CASES = [
+    ("global inline flag", [Rule("(?i)foo", "bar", regex=True)], "Foo foo FOO", "bar bar bar"),
+    ("global flag with another rule", [Rule("x", "y"), Rule("(?i)foo", "bar", regex=True)], "x FOO", "y bar"),
+    ("global verbose flag", [Rule("(?x) a  b ", "c", regex=True)], "ab", "c"),
+    ("same group name twice", [
+        Rule(r"(?P<n>\d+) mg", r"\g<n>mg", regex=True),
+        Rule(r"(?P<n>\d+) mL", r"\g<n>mL", regex=True),
+    ], "5 mg and 10 mL", "5mg and 10mL"),
+    ("named group after an escaped bracket", [Rule(r"\((?P<n>\w+)\)", r"[\g<n>]", regex=True)], "(a)", "[a]"),
+    ("unsupported global flag", [Rule("(?a)foo", "bar", regex=True)], "foo", ValueError),
+    ("global flag not at the start", [Rule("foo(?i)", "bar", regex=True)], "foo", ValueError),
+]
+
+
+def main():
+    failures = 0
+    for name, rules, text, expected in CASES:
+        try:
+            result = RuleSet(rules).apply(text)[0]
+        except ValueError as e:
+            result = ValueError
+            message = str(e)
+        except Exception as e:  # anything but ValueError crashes the update page
+            result = f"{type(e).__name__}: {e}"
+        if result == expected:
+            print(f"ok    {name}" + (f" ({message})" if result is ValueError else ""))
+            continue
+        failures += 1
+        print(f"FAIL  {name}: expected {expected!r}, got {result!r}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
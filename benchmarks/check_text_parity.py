@@ -0,0 +1,92 @@
+# Parity check between the .docx writers and the text writers.
+#
+#     python benchmarks/check_text_parity.py
+#
+# Builds a set of notes from the templates in the repo checkout (no network
+# access needed), renders each with every docx writer and with the text
+# writers, and checks that they carry the same content: the plain text must
+# equal the .docx read back paragraph by paragraph, and the Markdown must
+# equal the plain text once its markup is removed (Markdown drops blank
+# paragraphs and leading indentation, so those are left out of that
+# comparison). The .docx writers drop control characters XML cannot hold,
+# so a note with such text pasted in must still open, and read back as the
+# plain text without them. Exits non-zero on any difference.
+import difflib
+import os
+import re
+import sys
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from docx import Document  # noqa: E402
+
+from diagnosis_index import diagnosis_index, format_diagnosis_name  # noqa: E402
+from docx_writer import WRITERS, strip_invalid_xml  # noqa: E402
+from note_builder import build_note  # noqa: E402
+from text_writer import render_markdown, render_text  # noqa: E402
+
+
+# Function to read a .docx back as text, one line per paragraph
+def docx_text(data):
+    return "\n".join(para.text for para in Document(BytesIO(data)).paragraphs)
+
+
+# Function to strip the text writer's Markdown back to plain text
+def markdown_text(markdown):
+    lines = []
+    for line in markdown.split("\n\n"):
+        line = re.sub(r"(?<!\\)\*+", "", line.replace("  \n", "\n"))
+        lines.append(re.sub(r"\\(.)", r"\1", line))
+    return "\n".join(lines)
+
+
+# Function to lay plain text out the way Markdown keeps it
+def markdown_layout(text):
+    return "\n".join(line.lstrip(" \t") for line in text.split("\n") if line.strip())
+
+
+# Function to list the notes to check: (name, paragraphs)
+def cases():
+    ros_doc = Document(os.path.join(ROOT, "ros", "ros_rn.docx"))
+    exam_doc = Document(os.path.join(ROOT, "physicalexam", "Child_Physical_Exam_Day2.docx"))
+    diagnosis_index.ensure_fresh()
+    every_diagnosis = [format_diagnosis_name(key) for key in sorted(diagnosis_index.keys())]
+    yield "full note", build_note(
+        "Stable overnight. Weaned to 2L *NC* [goal > 92%].", "Critical care reason.", every_diagnosis[:10], exam_doc, ros_doc,
+        critical_care_time="35 minutes",
+    )
+    yield "every diagnosis", build_note("Assessment.", "", every_diagnosis, exam_doc, ros_doc)
+    yield "no templates", build_note("Assessment.", "", ["Sepsis"], None, None)
+    yield "free text", build_note(
+        "Line one\nline two\ttabbed", "", ["Anemia"], exam_doc, None,
+        free_text_diag="Rash_on #2 arm", free_text_plan="Topical `cream`",
+    )
+    yield "pasted control characters", build_note(
+        "Pasted\x0bfrom the EHR\x01\x00 with\x1f control\x0ccharacters.", "Reason\x08.", ["Sepsis"], exam_doc, ros_doc,
+        free_text_diag="Rash\x0b", free_text_plan="Plan\x1b",
+    )
+
+
+def main():
+    failures = 0
+    for name, paragraphs in cases():
+        text = render_text(paragraphs)
+        outputs = {writer: docx_text(render(paragraphs)) for writer, render in WRITERS.items()}
+        outputs["markdown"] = markdown_text(render_markdown(paragraphs))
+        for writer, output in outputs.items():
+            expected = markdown_layout(text) if writer == "markdown" else strip_invalid_xml(text)
+            if output == expected:
+                print(f"ok    {name} [{writer}]")
+                continue
+            failures += 1
+            print(f"FAIL  {name} [{writer}]")
+            sys.stdout.writelines(difflib.unified_diff(
+                expected.splitlines(True), output.splitlines(True), "text", writer, n=1,
+            ))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
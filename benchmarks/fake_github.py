@@ -0,0 +1,215 @@
+# Local stand-in for raw.githubusercontent.com and the GitHub contents API,
+# serving the templates from this checkout with configurable latency.
+#
+#     python benchmarks/fake_github.py [--port 8765] [--latency 0.05]
+#
+# then point the apps at it:
+#
+#     S_CHAR_RAW_BASE_URL=http://127.0.0.1:8765/conkraw/s_char/main \
+#     S_CHAR_API_BASE_URL=http://127.0.0.1:8765/repos/conkraw/s_char \
+#     streamlit run appy.py
+#
+# Routes:
+#   GET /<owner>/<repo>/<branch>/<path>            raw file bytes (ETag, 304 on If-None-Match)
+#   GET /repos/<owner>/<repo>/contents/<folder>    JSON folder listing
+#   GET /repos/<owner>/<repo>/git/trees/<branch>   JSON recursive tree listing
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OWNER_REPO = "conkraw/s_char"
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    server_version = "FakeGitHub/1.0"
+    # Keep-alive like GitHub, so the client's pooled connections are reused;
+    # headers and body are separate writes, so Nagle is off
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def do_GET(self):
+        self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.failing:
+            self._send(503, b"Service Unavailable", "text/plain")
+            return
+
+        path = unquote(urlsplit(self.path).path)
+        api_prefix = f"/repos/{OWNER_REPO}/contents"
+        tree_prefix = f"/repos/{OWNER_REPO}/git/trees/"
+        raw_prefix = f"/{OWNER_REPO}/"
+        if path.startswith(tree_prefix):
+            self._send_tree()
+        elif path == api_prefix or path.startswith(api_prefix + "/"):
+            self._send_listing(path[len(api_prefix):].strip("/"))
+        elif path.startswith(raw_prefix):
+            # /<owner>/<repo>/<branch>/<path>: drop the branch
+            _, _, file_path = path[len(raw_prefix):].partition("/")
+            self._send_file(file_path)
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _local_path(self, relative):
+        full = os.path.normpath(os.path.join(self.server.root, relative))
+        if not full.startswith(self.server.root):
+            return None
+        return full
+
+    def _send_file(self, relative):
+        full = self._local_path(relative)
+        if full is None or not os.path.isfile(full):
+            self._send(404, b"404: Not Found", "text/plain")
+            return
+        etag = f'"{_git_blob_sha(full)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", None, {"ETag": etag})
+            return
+        with open(full, "rb") as f:
+            self._send(200, f.read(), "application/octet-stream", {"ETag": etag})
+
+    def _send_listing(self, folder):
+        full = self._local_path(folder)
+        if full is None or not os.path.isdir(full):
+            self._send(404, json.dumps({"message": "Not Found"}).encode(), "application/json")
+            return
+        entries = []
+        for name in sorted(os.listdir(full)):
+            entry_path = os.path.join(full, name)
+            relative = f"{folder}/{name}".strip("/")
+            is_file = os.path.isfile(entry_path)
+            entries.append({
+                "name": name,
+                "path": relative,
+                "type": "file" if is_file else "dir",
+                "size": os.path.getsize(entry_path) if is_file else 0,
+                "sha": _git_blob_sha(entry_path) if is_file else "",
+                "download_url": f"{self.server.base_url}/{OWNER_REPO}/main/{relative}" if is_file else None,
+            })
+        self._send(200, json.dumps(entries).encode(), "application/json")
+
+    def _send_tree(self):
+        tree = []
+        for dirpath, dirnames, filenames in os.walk(self.server.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            relative_dir = os.path.relpath(dirpath, self.server.root)
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                relative = name if relative_dir == "." else f"{relative_dir}/{name}"
+                tree.append({"path": relative, "type": "blob", "size": os.path.getsize(full), "sha": _git_blob_sha(full)})
+            for name in dirnames:
+                relative = name if relative_dir == "." else f"{relative_dir}/{name}"
+                tree.append({"path": relative, "type": "tree"})
+        self._send(200, json.dumps({"sha": "0" * 40, "tree": tree, "truncated": False}).encode(), "application/json")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Function to compute the git blob SHA-1 of a file, as the contents API reports it
+def _git_blob_sha(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class _FakeGitHubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections waiting to be accepted: a burst of parallel downloads must
+    # not overflow the listen backlog and wait on SYN retransmits
+    request_queue_size = 128
+
+
+# Runs the stand-in server on a background thread:
+#
+#     with FakeGitHub(latency=0.05) as github:
+#         github.raw_base_url, github.api_base_url, github.request_count
+class FakeGitHub:
+    def __init__(self, latency=0.0, port=0, root=ROOT):
+        self.server = _FakeGitHubServer(("127.0.0.1", port), FakeGitHubHandler)
+        self.server.latency = latency
+        self.server.root = os.path.abspath(root)
+        self.server.request_count = 0
+        self.server.failing = False
+        self.server.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return self.server.base_url
+
+    @property
+    def raw_base_url(self):
+        return f"{self.base_url}/{OWNER_REPO}/main"
+
+    @property
+    def api_base_url(self):
+        return f"{self.base_url}/repos/{OWNER_REPO}"
+
+    @property
+    def request_count(self):
+        return self.server.request_count
+
+    def set_latency(self, latency):
+        self.server.latency = latency
+
+    # Answer every request with 503, as an upstream outage
+    def set_failing(self, failing):
+        self.server.failing = failing
+
+    # Point the app modules at this server (must run before they are imported)
+    def install_env(self):
+        os.environ["S_CHAR_RAW_BASE_URL"] = self.raw_base_url
+        os.environ["S_CHAR_API_BASE_URL"] = self.api_base_url
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve this checkout like raw.githubusercontent.com and the GitHub API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay added to every request")
+    args = parser.parse_args()
+
+    github = FakeGitHub(latency=args.latency, port=args.port)
+    print(f"S_CHAR_RAW_BASE_URL={github.raw_base_url}")
+    print(f"S_CHAR_API_BASE_URL={github.api_base_url}")
+    try:
+        github.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
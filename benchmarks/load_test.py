@@ -0,0 +1,266 @@
+# Load test: a shift of clinicians using the apps at once.
+#
+#     python benchmarks/load_test.py [--app appy.py] [--app app.py]
+#                                    [--sessions 1,2,4,8,16] [--notes 2]
+#                                    [--latency 0.02] [-o load.json]
+#
+# Each simulated clinician drives a headless Streamlit session (AppTest):
+# picks a ROS and a physical exam, types a room number and an assessment,
+# selects diagnoses and submits, `--notes` times over (app.py: pastes a
+# note and runs the replacement). AppTest keeps its runtime in global
+# state, so sessions cannot share an interpreter; every clinician runs in
+# its own process, the processes share the disk cache the way several app
+# workers on one host would, and all of them start together once they
+# have imported the app modules (and, unless --cold, warmed up). Templates
+# come from the local GitHub stand-in (fake_github.py), so runs are
+# repeatable offline.
+#
+# For every session count the report gives rerun and submit latency
+# percentiles, the error rate, throughput (submitted notes per second),
+# peak resident memory and template requests, so it shows where throughput
+# stops scaling. The memory figures are per process, and each process is a
+# whole interpreter holding one session: "per process" is the largest of
+# them and "total" their sum. That is an upper bound on what sessions
+# sharing one server process would use, since the interpreter, the
+# imported modules and the template caches are counted once per session.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_github import FakeGitHub  # noqa: E402
+
+ASSESSMENTS = [
+    "Stable overnight, weaned to room air.",
+    "Febrile overnight, blood culture sent, started on ceftriaxone.",
+    "Tolerating feeds, pain controlled on scheduled acetaminophen.",
+]
+RULE_TEXT = "ASSESSMENT:\nStable overnight.\nPLAN:\n" + "\n".join(f"{i}. Continue therapy." for i in range(1, 30))
+
+
+# Function to get the widget with this label from an AppTest element list
+def _widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"no widget labelled {label!r}")
+
+
+# Function to get this process's peak resident memory in bytes
+def _peak_rss_bytes():
+    import resource
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# One simulated clinician: records the latency of every rerun and submit,
+# and the errors seen (exceptions in the script, or raised by the driver)
+class Clinician:
+    def __init__(self, app, number, notes, timeout):
+        self.app = app
+        self.random = random.Random(number)
+        self.notes = notes
+        self.timeout = timeout
+        self.reruns = []
+        self.submits = []
+        self.errors = []
+        self.submitted = 0
+
+    # Function to run one interaction and time it
+    def _step(self, at, action, samples):
+        start = time.perf_counter()
+        action(at).run(timeout=self.timeout)
+        samples.append(time.perf_counter() - start)
+        if at.exception:
+            self.errors.append(at.exception[0].message)
+            return False
+        return True
+
+    def _appy_note(self, at):
+        from template_urls import physical_exam_files, ros_files
+
+        steps = [
+            lambda at: _widget(at.selectbox, "Select ROS file:").select(self.random.choice(list(ros_files))),
+            lambda at: _widget(at.selectbox, "Select Physical Exam file:").select(self.random.choice(list(physical_exam_files))),
+            lambda at: _widget(at.text_input, "Enter Room Number:").input(str(self.random.randint(1, 40))),
+            lambda at: _widget(at.text_area, "Enter Assessment:").input(self.random.choice(ASSESSMENTS)),
+            lambda at: _widget(at.multiselect, "Choose diagnoses:").set_value(
+                self.random.sample(_widget(at.multiselect, "Choose diagnoses:").options, 5)
+            ),
+        ]
+        for step in steps:
+            if not self._step(at, step, self.reruns):
+                return False
+        return self._step(at, lambda at: _widget(at.button, "Submit New Note").click(), self.submits)
+
+    def _app_note(self, at):
+        from template_urls import physical_exam_files, ros_files
+
+        steps = [
+            lambda at: _widget(at.selectbox, "Select ROS file:").select(self.random.choice(list(ros_files))),
+            lambda at: _widget(at.selectbox, "Select Physical Exam file:").select(self.random.choice(list(physical_exam_files))),
+            lambda at: _widget(at.text_input, "Enter Room Number:").input(str(self.random.randint(1, 40))),
+            lambda at: _widget(at.text_area, "Enter the text for the note you want to update:").input(RULE_TEXT),
+        ]
+        for step in steps:
+            if not self._step(at, step, self.reruns):
+                return False
+        return self._step(at, lambda at: _widget(at.button, "Replace").click(), self.submits)
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            at = AppTest.from_file(os.path.join(ROOT, self.app), default_timeout=self.timeout)
+            if not self._step(at, lambda at: at, self.reruns):
+                return
+            note = self._appy_note if self.app == "appy.py" else self._app_note
+            for _ in range(self.notes):
+                if note(at):
+                    self.submitted += 1
+        except Exception as e:  # the driver itself failed (timeout, missing widget)
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+# Function run in each session process: import (and warm) the app modules,
+# wait for every other session, then play one clinician and report back
+def _session(app, number, notes, timeout, warm, barrier, results):
+    from warmup import warm_up
+
+    if warm:
+        warm_up(background=False)
+    clinician = Clinician(app, number, notes, timeout)
+    barrier.wait()
+    clinician.run()
+    results.put({
+        "reruns": clinician.reruns,
+        "submits": clinician.submits,
+        "errors": clinician.errors,
+        "submitted": clinician.submitted,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    })
+
+
+# Function to summarize latency samples (seconds) in milliseconds
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))] * 1000
+
+    return {"count": len(samples), "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99),
+            "max_ms": samples[-1] * 1000, "mean_ms": statistics.fmean(samples) * 1000}
+
+
+# Function to run `sessions` clinicians at once against `app` and report
+def run_level(app, sessions, notes, timeout, github, warm=True):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_session, args=(app, number, notes, timeout, warm, barrier, results), daemon=True)
+        for number in range(sessions)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    requests_before = github.request_count
+    start = time.perf_counter()
+    clinicians = []
+    for process in processes:
+        try:
+            clinicians.append(results.get(timeout=timeout * (notes * 8 + 1)))
+        except Exception:
+            clinicians.append({"reruns": [], "submits": [], "errors": ["session process died"], "submitted": 0, "peak_rss_bytes": 0})
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    interactions = sum(len(c["reruns"]) + len(c["submits"]) for c in clinicians)
+    errors = [error for c in clinicians for error in c["errors"]]
+    submitted = sum(c["submitted"] for c in clinicians)
+    return {
+        "app": app,
+        "sessions": sessions,
+        "seconds": elapsed,
+        "notes_submitted": submitted,
+        "notes_per_second": submitted / elapsed if elapsed else 0.0,
+        "rerun": percentiles([s for c in clinicians for s in c["reruns"]]),
+        "submit": percentiles([s for c in clinicians for s in c["submits"]]),
+        "errors": len(errors),
+        "error_rate": len(errors) / max(interactions, 1),
+        "first_errors": errors[:3],
+        "process_peak_rss_bytes": max(c["peak_rss_bytes"] for c in clinicians),
+        "total_process_peak_rss_bytes": sum(c["peak_rss_bytes"] for c in clinicians),
+        "template_requests": github.request_count - requests_before,
+    }
+
+
+# Function to print one report line per session count
+def print_level(result, out=sys.stdout):
+    rerun = result["rerun"] or {}
+    submit = result["submit"] or {}
+    out.write(
+        f"{result['app']:8s} {result['sessions']:4d} sessions  "
+        f"rerun p50 {rerun.get('p50_ms', 0):7.1f} p99 {rerun.get('p99_ms', 0):7.1f} ms  "
+        f"submit p50 {submit.get('p50_ms', 0):7.1f} p99 {submit.get('p99_ms', 0):7.1f} ms  "
+        f"{result['notes_per_second']:6.2f} notes/s  errors {result['error_rate']:6.1%}  "
+        f"peak RSS {result['process_peak_rss_bytes'] / 2**20:6.1f} MB/process {result['total_process_peak_rss_bytes'] / 2**20:7.1f} MB total  "
+        f"requests {result['template_requests']}\n"
+    )
+    for error in result["first_errors"]:
+        out.write(f"    error: {error.splitlines()[0][:160]}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent clinicians against the apps.")
+    parser.add_argument("--app", action="append", default=None, help="app script (repeatable; default appy.py)")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="comma-separated concurrent session counts")
+    parser.add_argument("--notes", type=int, default=2, help="notes each clinician submits")
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in server latency per request (s)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a rerun counts as failed")
+    parser.add_argument("--cold", action="store_true", help="start sessions without warming their caches first")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here")
+    args = parser.parse_args(argv)
+    apps = args.app or ["appy.py"]
+    levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+
+    print("Each session runs in its own process; memory is peak RSS per process (one session each), not per session in a shared server.")
+    results = []
+    with FakeGitHub(latency=args.latency) as github, tempfile.TemporaryDirectory() as cache_dir:
+        github.install_env()
+        os.environ["S_CHAR_CACHE_DIR"] = cache_dir
+        os.environ.setdefault("S_CHAR_RULES_FILE", os.path.join(cache_dir, "replace_rules.json"))
+        for app in apps:
+            for sessions in levels:
+                result = run_level(app, sessions, args.notes, args.timeout, github, warm=not args.cold)
+                results.append(result)
+                print_level(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "latency_s": args.latency,
+                "notes_per_session": args.notes,
+                "memory": "peak RSS per process; one session per process",
+                "levels": results,
+            }, f, indent=2)
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# Benchmark suite for the note pipeline.
+#
+#     python benchmarks/run_benchmarks.py [-o results.json] [--latency 0.02]
+#                                         [--repeat 20] [--compare old.json]
+#
+# Remote fetches go to a local stand-in for GitHub (fake_github.py) with the
+# given per-request latency, so runs are repeatable offline. Results are
+# written as JSON (median / p95 / mean / min per benchmark, plus the commit
+# they were taken at). --compare prints the change against an earlier
+# results file and exits non-zero when a benchmark got slower than
+# --threshold.
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_github import FakeGitHub  # noqa: E402
+
+
+# Function to time `fn` `repeat` times and summarize the samples in milliseconds
+def measure(fn, repeat):
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "mean_ms": statistics.fmean(samples),
+        "min_ms": samples[0],
+    }
+
+
+# Function to build the benchmark table; the app modules are imported here,
+# after the environment points them at the stand-in server
+def benchmarks():
+    from diagnosis_catalog import diagnosis_catalog
+    from diagnosis_index import diagnosis_index, format_diagnosis_name
+    from disk_cache import DiskCache, disk_cache
+    from fetch_client import fetch_client
+    from github_fetch import fetch_file_content, fetch_files_from_github
+    from note_builder import TemplateSource, combine_notes, combine_notes_text, create_word_doc, physical_exam_fragment, ros_paragraphs
+    from note_editor import edit_note
+    from prefetch import prefetcher
+    from replace_rules import Rule, apply_rules, compile_rules
+    from template_cache import fetch_docx, get_docx, template_cache, warm_templates
+    from template_urls import physical_exam_files, ros_files
+    from text_index import sync_diagnoses, sync_remote_templates, text_index
+
+    diagnosis_index.ensure_fresh()
+    names = sorted(diagnosis_index.keys())
+    diagnoses = [format_diagnosis_name(name) for name in names]
+    ros_url = ros_files["ROS_RN"]
+    exam_url = physical_exam_files["Child Day 2"]
+    get_docx(ros_url)
+    get_docx(exam_url)
+
+    def note(count, writer=None):
+        selected = (diagnoses * (count // len(diagnoses) + 1))[:count]
+        return lambda: combine_notes(
+            "Assessment text.", "Critical care reason.", selected,
+            physical_exam_day=TemplateSource(exam_url), ros_file=TemplateSource(ros_url),
+            critical_care_time="35 minutes", writer=writer,
+        )
+
+    def note_text(count, markdown=False):
+        selected = (diagnoses * (count // len(diagnoses) + 1))[:count]
+        return lambda: combine_notes_text(
+            "Assessment text.", "Critical care reason.", selected,
+            physical_exam_day=TemplateSource(exam_url), ros_file=TemplateSource(ros_url),
+            critical_care_time="35 minutes", markdown=markdown,
+        )
+
+    def warm_all_exams():
+        template_cache.clear()
+        warm_templates(physical_exam_files.values())
+
+    def fetch_all_exams_serially():
+        for url in physical_exam_files.values():
+            fetch_docx(url)
+
+    def list_folder_uncached():
+        fetch_client._tree = None
+        return fetch_files_from_github("physicalexam")
+
+    sync_diagnoses()
+    sync_remote_templates()
+
+    no_disk = DiskCache(directory="")
+    revalidating = DiskCache(directory=disk_cache.directory, fresh_seconds=0)
+
+    update_text = "\n".join(["ASSESSMENT:", "Stable overnight.", "PLAN:"] + [f"{i}. Continue therapy." for i in range(40)])
+
+    # ~2 MB of note text against 60 literal rules plus two common ones
+    long_note = update_text * 1200
+    replace_rules = [
+        Rule(f"phrase {i}", f"P{i}", whole_word=i % 2 == 0, ignore_case=i % 3 == 0) for i in range(60)
+    ] + [Rule("Continue", "Will continue", whole_word=True), Rule("therapy", "treatment", ignore_case=True)]
+
+    def replace_chained():
+        text = long_note
+        for rule in replace_rules:
+            pattern = re.escape(rule.find)
+            if rule.whole_word:
+                pattern = r"(?<!\w)(?:%s)(?!\w)" % pattern
+            text = re.sub(pattern, rule.replace, text, flags=re.IGNORECASE if rule.ignore_case else 0)
+        return text
+
+    # An existing 50-diagnosis note, edited in place
+    existing_note = note(50)()
+    note_rules = compile_rules((Rule("No acute events", "No new events"), Rule("Continue", "Will continue", whole_word=True)))
+    new_exam = {"OBJECTIVE:": [physical_exam_fragment(get_docx(physical_exam_files["Child Day 3"]))]}
+
+    return {
+        "read_docx_from_url[download]": lambda: no_disk.fetch(exam_url),
+        "read_docx_from_url[disk,fresh]": lambda: disk_cache.fetch(exam_url),
+        "read_docx_from_url[disk,304]": lambda: revalidating.fetch(exam_url),
+        "read_docx_from_url[uncached]": lambda: fetch_docx(exam_url),
+        "read_docx_from_url[cached]": lambda: get_docx(exam_url),
+        "fetch_files_from_github[physicalexam]": list_folder_uncached,
+        "fetch_files_from_github[physicalexam,cached tree]": lambda: fetch_files_from_github("physicalexam"),
+        "load_physical_exams[28,serial]": fetch_all_exams_serially,
+        "load_physical_exams[28,parallel]": warm_all_exams,
+        "download_physical_exams[28,parallel]": lambda: fetch_client.get_many(physical_exam_files.values()),
+        "fetch_file_content": lambda: fetch_file_content("physicalexam", "Child_Physical_Exam_Day2.docx"),
+        "combine_notes[1]": note(1),
+        "combine_notes[10]": note(10),
+        "combine_notes[50]": note(50),
+        "combine_notes[10,python-docx]": note(10, "python-docx"),
+        "combine_notes_text[10]": note_text(10),
+        "combine_notes_text[10,markdown]": note_text(10, markdown=True),
+        "apply_rules[62 rules,2MB]": lambda: apply_rules(long_note, replace_rules),
+        "apply_rules[62 rules,2MB,chained re.sub]": replace_chained,
+        "edit_note[50,rules]": lambda: edit_note(existing_note, note_rules),
+        "edit_note[50,swap OBJECTIVE]": lambda: edit_note(existing_note, None, new_exam),
+        "ros_paragraphs[ROS_RN]": lambda: ros_paragraphs(get_docx(ros_url)),
+        "prefetch[queue,warm]": lambda: prefetcher.prefetch("ROS_RN", "Child Day 2", diagnoses[:5]),
+        "create_word_doc": lambda: create_word_doc(update_text, "ROS text.", "Neuro: normal\nResp: clear"),
+        "format_diagnosis_name[all]": lambda: [format_diagnosis_name(name) for name in names],
+        "diagnosis_catalog.search[prefix]": lambda: diagnosis_catalog.search("hypo"),
+        "diagnosis_catalog.search[typo]": lambda: diagnosis_catalog.search("hyponatermia"),
+        "text_index.search[word]": lambda: text_index.search("fentanyl"),
+        "text_index.search[phrase prefix]": lambda: text_index.search("capillary ref"),
+        "text_index.sync_diagnoses[unchanged]": sync_diagnoses,
+    }
+
+
+# The benchmarks cold_start_results reports
+COLD_START_BENCHMARKS = ("cold_start[appy,warm_up]", "cold_start[appy,first_render]")
+
+
+# Function to profile cold starts of appy.py in fresh interpreters; each one
+# is slow, so these run a few times rather than `repeat` times
+def cold_start_results(runs=3):
+    from warmup import profile_cold_start
+
+    samples = {name: [] for name in COLD_START_BENCHMARKS}
+    for _ in range(runs):
+        profile = profile_cold_start("appy.py", env=dict(os.environ))
+        samples["cold_start[appy,warm_up]"].append(profile["warm_up_total"] * 1000)
+        samples["cold_start[appy,first_render]"].append(profile["first_render"] * 1000)
+    results = {}
+    for name, values in samples.items():
+        values.sort()
+        results[name] = {
+            "runs": runs,
+            "median_ms": statistics.median(values),
+            "p95_ms": values[-1],
+            "mean_ms": statistics.fmean(values),
+            "min_ms": values[0],
+        }
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to print how each benchmark moved against a baseline; returns the regressions
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('commit')}:")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:40s} {old['median_ms']:9.2f} -> {result['median_ms']:9.2f} ms  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the note pipeline against a local GitHub stand-in.")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here")
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in server latency per request (s)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", default=None, help="run only benchmarks whose name contains this")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slow-down that counts as a regression")
+    args = parser.parse_args(argv)
+
+    with FakeGitHub(latency=args.latency) as github, tempfile.TemporaryDirectory() as cache_dir:
+        github.install_env()
+        os.environ["S_CHAR_CACHE_DIR"] = cache_dir
+        results = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "latency_s": args.latency,
+                "repeat": args.repeat,
+            },
+            "results": {},
+        }
+        for name, fn in benchmarks().items():
+            if args.only and args.only not in name:
+                continue
+            result = measure(fn, args.repeat)
+            results["results"][name] = result
+            print(f"{name:40s} median {result['median_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms")
+        # Matched by --only like the others; the interpreters start only if one matches
+        if not args.only or any(args.only in name for name in COLD_START_BENCHMARKS):
+            for name, result in cold_start_results().items():
+                if args.only and args.only not in name:
+                    continue
+                results["results"][name] = result
+                print(f"{name:40s} median {result['median_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import bisect
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from diagnosis_index import diagnosis_index, diagnosis_key, format_diagnosis_name
+
+# How many matches search() returns by default
+SEARCH_LIMIT = 50
+
+
+# Function to split text into lowercase word tokens
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+# Function to list a token's padded trigrams ("$$a", "$an", "ane", ...)
+def _trigrams(token):
+    padded = f"$${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Function to allow more typos in longer words
+def _max_typos(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+# Function to compute the edit distance between a and b, or None once it
+# is certain to exceed `limit`
+def _bounded_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+# One built catalog: the names and the indexes over them. A rebuild makes a
+# new one and swaps it in with a single assignment, and every lookup reads
+# one snapshot throughout, so it never mixes two generations.
+_CatalogState = namedtuple("_CatalogState", ["generation", "names", "lower", "keys", "postings", "vocab", "grams"])
+_EMPTY_STATE = _CatalogState(None, [], [], {}, {}, [], {})
+
+
+# Searchable list of diagnosis display names, built once from the diagnosis
+# index and rebuilt only when a template is added, changed or removed.
+# Lookups use a sorted name list (prefix), a token index with a sorted
+# vocabulary (token prefix) and a trigram index over the vocabulary
+# (typos), so a query never scans every name.
+class DiagnosisCatalog:
+    def __init__(self, index=diagnosis_index):
+        self.index = index
+        self._lock = threading.Lock()
+        self._state = _EMPTY_STATE
+
+    # Function to rebuild the catalog if the index changed; returns the
+    # current snapshot
+    def ensure_fresh(self):
+        self.index.ensure_fresh()
+        if self._state.generation != self.index.generation:
+            with self._lock:
+                if self._state.generation != self.index.generation:
+                    self._build()
+        return self._state
+
+    def _build(self):
+        generation = self.index.generation
+        keys = {format_diagnosis_name(key): key for key in self.index.keys()}
+        names = sorted(keys, key=str.lower)
+        postings = defaultdict(set)
+        for i, name in enumerate(names):
+            for token in _tokens(name):
+                postings[token].add(i)
+        grams = defaultdict(set)
+        for token in postings:
+            for gram in _trigrams(token):
+                grams[gram].add(token)
+        # Swap everything in at once; searches in other sessions keep using
+        # the previous snapshot
+        self._state = _CatalogState(
+            generation, names, [name.lower() for name in names], keys, dict(postings), sorted(postings), dict(grams),
+        )
+
+    # All display names, alphabetically
+    def names(self):
+        return self.ensure_fresh().names
+
+    # Template key for a display name; names typed elsewhere (batch census
+    # files) fall back to the plain lowercase/underscore convention
+    def key_for(self, name):
+        key = self.ensure_fresh().keys.get(name)
+        if key is None:
+            key = diagnosis_key(name)
+        return key
+
+    # Entry ids whose tokens start with `token`, via the sorted vocabulary
+    def _prefix_matches(self, state, token):
+        ids = set()
+        start = bisect.bisect_left(state.vocab, token)
+        for word in state.vocab[start:]:
+            if not word.startswith(token):
+                break
+            ids |= state.postings[word]
+        return ids
+
+    # {entry id: typos} for tokens within a few edits of `token`
+    def _fuzzy_matches(self, state, token):
+        limit = _max_typos(token)
+        if not limit:
+            return {}
+        candidates = set()
+        for gram in _trigrams(token):
+            candidates |= state.grams.get(gram, set())
+        matches = {}
+        for word in candidates:
+            distance = _bounded_distance(token, word, limit)
+            if distance is None:
+                continue
+            for i in state.postings[word]:
+                matches[i] = min(distance, matches.get(i, distance))
+        return matches
+
+    # Display names matching `query`, best first: whole-name prefix, then
+    # every word matching a word prefix, then matches that needed typo fixes
+    def search(self, query, limit=SEARCH_LIMIT):
+        state = self.ensure_fresh()
+        lowered = " ".join(_tokens(query))
+        if not lowered:
+            return state.names[:limit]
+
+        scores = {}
+        start = bisect.bisect_left(state.lower, lowered)
+        for i in range(start, len(state.lower)):
+            if not state.lower[i].startswith(lowered):
+                break
+            scores[i] = 0
+
+        matched = None
+        for token in lowered.split():
+            costs = dict.fromkeys(self._prefix_matches(state, token), 0)
+            for i, typos in self._fuzzy_matches(state, token).items():
+                costs.setdefault(i, typos)
+            if matched is None:
+                matched = costs
+            else:
+                matched = {i: matched[i] + cost for i, cost in costs.items() if i in matched}
+            if not matched:
+                break
+        for i, typos in (matched or {}).items():
+            scores.setdefault(i, 1 + typos)
+
+        ranked = sorted(scores, key=lambda i: (scores[i], len(state.names[i]), state.lower[i]))
+        return [state.names[i] for i in ranked[:limit]]
+
+    def __len__(self):
+        return len(self.ensure_fresh().names)
+
+
+diagnosis_catalog = DiagnosisCatalog()
@@ -0,0 +1,119 @@
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from template_store import TemplateStore
+
+# Where the diagnosis templates live (the top level of the repo)
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# How often (seconds) the directory is re-checked for changed templates
+STAT_INTERVAL_SECONDS = 30
+
+# A compiled template paragraph: its text plus (text, bold, italic, underline) runs
+RunSpec = namedtuple("RunSpec", ["text", "bold", "italic", "underline"])
+ParagraphSpec = namedtuple("ParagraphSpec", ["text", "runs"])
+
+# A compiled template: like a Document it has .paragraphs (ParagraphSpecs),
+# but it is a few tuples instead of an lxml tree with styles, numbering and
+# theme parts. Immutable, so one copy is shared by every session.
+TemplateRecord = namedtuple("TemplateRecord", ["paragraphs"])
+
+
+# Function to build a ParagraphSpec; a paragraph that is a single run keeps
+# one string for both texts
+def paragraph_spec(text, runs):
+    if len(runs) == 1 and runs[0].text == text:
+        runs = (runs[0]._replace(text=text),)
+    return ParagraphSpec(text, runs)
+
+
+# Function to compile a parsed Document into a list of ParagraphSpecs
+def compile_document(doc):
+    paragraphs = []
+    for para in doc.paragraphs:
+        runs = tuple(RunSpec(run.text, run.bold, run.italic, run.underline) for run in para.runs)
+        paragraphs.append(paragraph_spec(para.text, runs))
+    return tuple(paragraphs)
+
+
+# Function to format diagnosis names
+def format_diagnosis_name(diagnosis):
+    diagnosis = diagnosis.replace('_', ' ')
+    formatted_name = re.sub(r'(?<!^)(?=[A-Z])', ' ', diagnosis)
+    formatted_name = formatted_name.title()
+    return formatted_name
+
+
+# Function to turn a displayed diagnosis name into its template key
+def diagnosis_key(diagnosis):
+    return diagnosis.lower().replace(' ', '_')
+
+
+# Function to fetch compiled paragraphs from the template bundle, if built
+def _bundled_paragraphs(digest):
+    from template_bundle import bundled_paragraphs
+    return bundled_paragraphs(digest)
+
+
+# In-memory index of every diagnosis template: key (file name without .docx)
+# -> compiled paragraphs. Built in one pass, then a template is only
+# re-read when its mtime or size changes. Parsed entries live in a
+# content-addressed store, so byte-identical templates are parsed once, and
+# templates found in the packed bundle are not parsed at all.
+class DiagnosisIndex:
+    def __init__(self, directory=TEMPLATE_DIR, stat_interval=STAT_INTERVAL_SECONDS):
+        self.directory = directory
+        self.stat_interval = stat_interval
+        self.store = TemplateStore(compile_document, _bundled_paragraphs)
+        self._stats = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+        # Bumped whenever a template is added, changed or removed, so anything
+        # built from the templates (the diagnosis catalog, the text index)
+        # knows to rebuild
+        self.generation = 0
+
+    # Scan the directory and (re)compile anything new or changed
+    def refresh(self):
+        with self._lock:
+            seen = set()
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.docx') or not entry.is_file():
+                    continue
+                key = entry.name[:-5]
+                seen.add(key)
+                st = entry.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+                if self._stats.get(key) != stamp:
+                    with open(entry.path, "rb") as f:
+                        self.store.add(key, f.read())
+                    self._stats[key] = stamp
+                    self.generation += 1
+            for key in set(self._stats) - seen:
+                self.store.discard(key)
+                del self._stats[key]
+                self.generation += 1
+            self._checked_at = time.monotonic()
+
+    # Warm-up: build the index if it has never been built, or re-check it
+    # when the stat interval has passed
+    def ensure_fresh(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at > self.stat_interval:
+            self.refresh()
+
+    def get(self, key):
+        self.ensure_fresh()
+        return self.store.get(key)
+
+    def keys(self):
+        self.ensure_fresh()
+        return self.store.names()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+diagnosis_index = DiagnosisIndex()
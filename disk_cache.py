@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, writes are still atomic
+    fcntl = None
+
+import requests
+
+from fetch_client import fetch_client
+from note_metrics import span
+
+# Shared by every app process on the host; set S_CHAR_CACHE_DIR="" to turn it off
+CACHE_DIR = os.environ.get(
+    "S_CHAR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "s_char", "templates")
+)
+
+# A stored copy younger than this is used without asking upstream at all;
+# older copies are revalidated with If-None-Match / If-Modified-Since
+FRESH_SECONDS = 5 * 60
+
+# How old a stored copy may be and still be served when upstream is unreachable
+STALE_IF_ERROR_SECONDS = 7 * 24 * 60 * 60
+
+# Statuses that mean "upstream is having trouble", not "the file is gone"
+UPSTREAM_ERROR_STATUSES = (429, 500, 502, 503, 504)
+
+
+# Directory of downloaded template bytes plus their validators, shared by all
+# local processes. Each URL maps to <key>.body and <key>.json; both are
+# replaced atomically, and a per-URL lock file makes one process at a time
+# revalidate a URL while the others wait and then reuse its result. The
+# directory is created on first use; if it cannot be (read-only or
+# unwritable home), the cache is skipped and templates come straight from
+# upstream.
+class DiskCache:
+    def __init__(self, directory=CACHE_DIR, fresh_seconds=FRESH_SECONDS,
+                 stale_if_error_seconds=STALE_IF_ERROR_SECONDS, client=fetch_client):
+        self.directory = directory
+        self.fresh_seconds = fresh_seconds
+        self.stale_if_error_seconds = stale_if_error_seconds
+        self.client = client
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.stale_served = 0
+        self._usable = None
+
+    # Whether the directory exists and can be written, creating it once
+    def _ready(self):
+        if self._usable is None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._usable = os.access(self.directory, os.W_OK)
+            except OSError:
+                self._usable = False
+        return self._usable
+
+    def _path(self, url, suffix):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + suffix)
+
+    @contextmanager
+    def _locked(self, url):
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(url, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    # The stored (meta, body) for a URL, or (None, None)
+    def read(self, url):
+        try:
+            with open(self._path(url, ".json")) as f:
+                meta = json.load(f)
+            with open(self._path(url, ".body"), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        # The body is written first, so a reader can see new bytes with old
+        # metadata; the digest catches that and any truncated file
+        if hashlib.sha256(body).hexdigest() != meta.get("sha256"):
+            return None, None
+        return meta, body
+
+    def write(self, url, body, etag=None, last_modified=None):
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "checked_at": time.time(),
+        }
+        self._write_atomic(self._path(url, ".body"), body)
+        self._write_atomic(self._path(url, ".json"), json.dumps(meta).encode())
+        return meta
+
+    # Record that upstream confirmed the stored copy is still current
+    def touch(self, url, meta):
+        meta = dict(meta, checked_at=time.time())
+        self._write_atomic(self._path(url, ".json"), json.dumps(meta).encode())
+
+    def _is_fresh(self, meta):
+        return time.time() - meta["checked_at"] < self.fresh_seconds
+
+    def _can_serve_stale(self, meta):
+        return time.time() - meta["checked_at"] < self.stale_if_error_seconds
+
+    # The bytes at `url`: from disk while fresh, after a conditional request
+    # once stale, and from the stale copy if upstream cannot be reached
+    def fetch(self, url):
+        if not self.directory or not self._ready():
+            with span("template.fetch"):
+                response = self.client.get(url)
+            response.raise_for_status()
+            return response.content
+
+        meta, body = self.read(url)
+        if meta is not None and self._is_fresh(meta):
+            self.hits += 1
+            return body
+
+        with self._locked(url):
+            # Another process may have refreshed it while we waited for the lock
+            meta, body = self.read(url)
+            if meta is not None and self._is_fresh(meta):
+                self.hits += 1
+                return body
+
+            headers = {}
+            if meta is not None:
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+            try:
+                with span("template.fetch"):
+                    if meta is not None:
+                        # A stored copy to fall back on: one quick attempt
+                        response = self.client.get_once(url, headers=headers)
+                    else:
+                        response = self.client.get(url, headers=headers)
+            except requests.exceptions.RequestException:
+                if meta is not None and self._can_serve_stale(meta):
+                    self.stale_served += 1
+                    return body
+                raise
+
+            if response.status_code == 304 and meta is not None:
+                self.touch(url, meta)
+                self.revalidated += 1
+                return body
+            if response.status_code in UPSTREAM_ERROR_STATUSES and meta is not None and self._can_serve_stale(meta):
+                self.stale_served += 1
+                return body
+            response.raise_for_status()
+            try:
+                self.write(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            except OSError:
+                pass  # disk full or the directory went read-only: still serve the download
+            self.downloads += 1
+            return response.content
+
+    # Stored URLs, for warming a freshly started process
+    def urls(self):
+        if not self.directory or not self._ready():
+            return []
+        urls = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") and not name.startswith("."):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        urls.append(json.load(f)["url"])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return urls
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "downloads": self.downloads,
+            "stale_served": self.stale_served,
+        }
+
+
+disk_cache = DiskCache()
@@ -0,0 +1,328 @@
+import importlib.util
+import os
+import re
+import zipfile
+from collections import namedtuple
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from note_metrics import span
+from template_cache import TemplateCache
+
+# The note font applied to every styled paragraph
+NOTE_FONT_NAME = 'Arial'
+NOTE_FONT_SIZE = 9
+
+# Writer used when combine_notes / create_word_doc are not told otherwise
+DEFAULT_WRITER = "fast"
+
+# Rendered fragments kept per process (a fragment's XML is a few KB)
+FRAGMENT_TTL_SECONDS = 60 * 60
+FRAGMENT_MAX_ENTRIES = 512
+
+# A block of note paragraphs that comes out the same in every note built
+# from the same source: the header, a ROS / physical exam template, a
+# diagnosis plan. build() returns the paragraphs. The fast writer renders
+# them once per key and splices the cached XML into later notes; when
+# `source` is given, the cached XML is only reused for that same object.
+Fragment = namedtuple("Fragment", ["key", "build", "source"], defaults=(None,))
+
+fragment_cache = TemplateCache(ttl=FRAGMENT_TTL_SECONDS, max_entries=FRAGMENT_MAX_ENTRIES)
+
+# Control characters XML does not allow (tab, newline and carriage return
+# are fine); text pasted from an EHR can carry them
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+# Function to drop the characters a .docx cannot hold, so a note with pasted
+# text still opens in Word
+def strip_invalid_xml(text):
+    return _INVALID_XML_CHARS.sub('', text)
+
+
+# Function to flatten note items (paragraphs and fragments) into paragraphs
+def expand(items):
+    for item in items:
+        if isinstance(item, Fragment):
+            yield from item.build()
+        else:
+            yield item
+
+
+# Function to render note paragraphs with python-docx, setting the font and
+# spacing on every run and paragraph (the original, slower way). python-docx
+# is only imported here, since the fast writer never needs it.
+def render_python_docx(paragraphs):
+    from docx import Document
+    from docx.shared import Pt
+
+    doc = Document()
+
+    for para in expand(paragraphs):
+        p = doc.add_paragraph()
+        for note_run in para.runs:
+            run = p.add_run(strip_invalid_xml(note_run.text))
+            if note_run.bold is not None:
+                run.bold = note_run.bold
+            if note_run.italic is not None:
+                run.italic = note_run.italic
+            if note_run.underline is not None:
+                run.underline = note_run.underline
+            if para.styled:
+                run.font.name = NOTE_FONT_NAME
+                run.font.size = Pt(NOTE_FONT_SIZE)
+        if para.space_before is not None:
+            p.paragraph_format.space_before = Pt(para.space_before)
+        if para.space_after is not None:
+            p.paragraph_format.space_after = Pt(para.space_after)
+        if para.line_spacing is not None:
+            p.paragraph_format.line_spacing = Pt(para.line_spacing)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Fast writer: streams WordprocessingML into a lean base package whose styles
+# carry the note font and spacing, so paragraphs only reference a style.
+# ---------------------------------------------------------------------------
+
+# Paragraph style for each (space_before, space_after) pair, in points.
+# Any other pair uses NoteText with the spacing written on the paragraph.
+PARAGRAPH_STYLES = {
+    (None, None): "NoteText",
+    (0, 0): "NoteBody",
+    (6, 6): "NoteSpaced",
+    (6, 0): "NoteSpacedBefore",
+    (0, 6): "NoteSpacedAfter",
+}
+
+# The note paragraph styles and the NoteHeading run style, for any styles
+# part paragraph_xml output goes into (also used by note_editor.py)
+NOTE_STYLES_XML = (
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="NoteText">'
+    '<w:name w:val="Note Text"/><w:basedOn w:val="Normal"/><w:qFormat/>'
+    '<w:rPr><w:rFonts w:ascii="{font}" w:hAnsi="{font}"/><w:sz w:val="{size}"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="NoteBody">'
+    '<w:name w:val="Note Body"/><w:basedOn w:val="NoteText"/><w:qFormat/>'
+    '<w:pPr><w:spacing w:before="0" w:after="0"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="NoteSpaced">'
+    '<w:name w:val="Note Spaced"/><w:basedOn w:val="NoteText"/>'
+    '<w:pPr><w:spacing w:before="120" w:after="120"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="NoteSpacedBefore">'
+    '<w:name w:val="Note Spaced Before"/><w:basedOn w:val="NoteText"/>'
+    '<w:pPr><w:spacing w:before="120" w:after="0"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="NoteSpacedAfter">'
+    '<w:name w:val="Note Spaced After"/><w:basedOn w:val="NoteText"/>'
+    '<w:pPr><w:spacing w:before="0" w:after="120"/></w:pPr></w:style>'
+    '<w:style w:type="character" w:customStyle="1" w:styleId="NoteHeading">'
+    '<w:name w:val="Note Heading"/><w:basedOn w:val="DefaultParagraphFont"/><w:qFormat/>'
+    '<w:rPr><w:b/><w:u w:val="single"/></w:rPr></w:style>'
+).format(font=NOTE_FONT_NAME, size=NOTE_FONT_SIZE * 2)
+
+_CONTENT_TYPES_XML = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>'
+    '<Override PartName="/word/fontTable.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.fontTable+xml"/>'
+    '<Override PartName="/word/theme/theme1.xml" ContentType="application/vnd.openxmlformats-officedocument.theme+xml"/>'
+    '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+    '<Override PartName="/docProps/app.xml" ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>'
+    '</Types>'
+)
+
+_PACKAGE_RELS_XML = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/extended-properties" Target="docProps/app.xml"/>'
+    '</Relationships>'
+)
+
+_DOCUMENT_RELS_XML = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/fontTable" Target="fontTable.xml"/>'
+    '<Relationship Id="rId4" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/theme" Target="theme/theme1.xml"/>'
+    '</Relationships>'
+)
+
+_DOCUMENT_HEAD = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><w:body>'
+)
+
+# Default styles kept from the python-docx template; everything else
+# (latent styles, the ~150 unused built-in styles) is dropped
+_KEPT_STYLE_IDS = ("Normal", "DefaultParagraphFont", "TableNormal", "NoList")
+
+_BREAKS = re.compile(r'([\t\n\r])')
+
+
+# Function to build the lean base package once: the python-docx default
+# template's settings, fonts and theme, plus a trimmed styles part with the
+# note styles added. Returns (static parts, section properties XML).
+@lru_cache(maxsize=1)
+def _base_package():
+    # Located without importing python-docx (and lxml) at all
+    docx_dir = importlib.util.find_spec('docx').submodule_search_locations[0]
+    template_path = os.path.join(docx_dir, 'templates', 'default.docx')
+    with zipfile.ZipFile(template_path) as template:
+        styles = template.read('word/styles.xml').decode('utf-8')
+        document = template.read('word/document.xml').decode('utf-8')
+        parts = {
+            name: template.read(name)
+            for name in ('word/settings.xml', 'word/fontTable.xml', 'word/theme/theme1.xml',
+                         'docProps/core.xml', 'docProps/app.xml')
+        }
+
+    root_open = re.search(r'<w:styles\b[^>]*>', styles).group(0)
+    doc_defaults = re.search(r'<w:docDefaults>.*?</w:docDefaults>', styles, re.S).group(0)
+    kept = [
+        re.search(r'<w:style [^>]*w:styleId="%s".*?</w:style>' % style_id, styles, re.S).group(0)
+        for style_id in _KEPT_STYLE_IDS
+    ]
+    lean_styles = (
+        "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+        + root_open + doc_defaults + ''.join(kept) + NOTE_STYLES_XML + '</w:styles>'
+    )
+
+    parts['[Content_Types].xml'] = _CONTENT_TYPES_XML.encode('utf-8')
+    parts['_rels/.rels'] = _PACKAGE_RELS_XML.encode('utf-8')
+    parts['word/_rels/document.xml.rels'] = _DOCUMENT_RELS_XML.encode('utf-8')
+    parts['word/styles.xml'] = lean_styles.encode('utf-8')
+
+    sect_pr = re.search(r'<w:sectPr\b.*?</w:sectPr>', document, re.S).group(0)
+    return parts, sect_pr
+
+
+# Function to turn run text into <w:t>, <w:tab/> and <w:br/> elements,
+# the same way python-docx's add_run handles tabs and line breaks
+def _run_content_xml(text):
+    out = []
+    for piece in _BREAKS.split(strip_invalid_xml(text)):
+        if piece == '\t':
+            out.append('<w:tab/>')
+        elif piece in ('\n', '\r'):
+            out.append('<w:br/>')
+        elif piece:
+            out.append('<w:t xml:space="preserve">%s</w:t>' % escape(piece))
+    return ''.join(out)
+
+
+def _run_xml(note_run):
+    props = []
+    if note_run.bold and note_run.underline:
+        props.append('<w:rStyle w:val="NoteHeading"/>')
+        if note_run.italic:
+            props.append('<w:i/>')
+    else:
+        if note_run.bold:
+            props.append('<w:b/>')
+        if note_run.italic:
+            props.append('<w:i/>')
+        if note_run.underline:
+            props.append('<w:u w:val="single"/>')
+    rpr = '<w:rPr>%s</w:rPr>' % ''.join(props) if props else ''
+    return '<w:r>%s%s</w:r>' % (rpr, _run_content_xml(note_run.text))
+
+
+# Function to render one NoteParagraph as a <w:p> element (styled
+# paragraphs use the NOTE_STYLES_XML paragraph styles)
+def paragraph_xml(para):
+    props = []
+    spacing_key = (para.space_before, para.space_after)
+    explicit_spacing = True
+    if para.styled:
+        style_id = PARAGRAPH_STYLES.get(spacing_key)
+        if style_id is None:
+            style_id = PARAGRAPH_STYLES[(None, None)]
+        else:
+            explicit_spacing = False
+        props.append('<w:pStyle w:val="%s"/>' % style_id)
+
+    spacing = []
+    if explicit_spacing and para.space_before is not None:
+        spacing.append('w:before="%d"' % (para.space_before * 20))
+    if explicit_spacing and para.space_after is not None:
+        spacing.append('w:after="%d"' % (para.space_after * 20))
+    if para.line_spacing is not None:
+        spacing.append('w:line="%d" w:lineRule="exact"' % (para.line_spacing * 20))
+    if spacing:
+        props.append('<w:spacing %s/>' % ' '.join(spacing))
+
+    ppr = '<w:pPr>%s</w:pPr>' % ''.join(props) if props else ''
+    return '<w:p>%s%s</w:p>' % (ppr, ''.join(_run_xml(note_run) for note_run in para.runs))
+
+
+# Function to get a fragment's XML, rendering it only on a cache miss
+def fragment_xml(fragment):
+    cached = fragment_cache.get(fragment.key)
+    if cached is not None and cached[0] is fragment.source:
+        return cached[1]
+    xml = ''.join(paragraph_xml(para) for para in fragment.build())
+    fragment_cache.put(fragment.key, (fragment.source, xml))
+    return xml
+
+
+# Function to render note items (paragraphs and Fragments) as the XML of
+# consecutive <w:p> elements, splicing in cached fragments as-is
+def body_xml(items):
+    return ''.join(fragment_xml(item) if isinstance(item, Fragment) else paragraph_xml(item) for item in items)
+
+
+# Function to render fragments into the cache ahead of the note that needs
+# them (see prefetch.py)
+def warm_fragments(fragments):
+    for fragment in fragments:
+        fragment_xml(fragment)
+
+
+# Function to build the skeleton package once: every part except
+# document.xml, already compressed, so a note only adds its own body
+@lru_cache(maxsize=1)
+def _skeleton():
+    parts, sect_pr = _base_package()
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', parts['[Content_Types].xml'])
+        package.writestr('_rels/.rels', parts['_rels/.rels'])
+        for name, data in parts.items():
+            if name not in ('[Content_Types].xml', '_rels/.rels'):
+                package.writestr(name, data)
+    return buffer.getvalue(), sect_pr
+
+
+# Function to render note items by writing document.xml directly (cached
+# fragments are spliced in as-is) and appending it to a copy of the skeleton
+def render_fast(paragraphs):
+    skeleton, sect_pr = _skeleton()
+    body = body_xml(paragraphs)
+    document_xml = _DOCUMENT_HEAD + body + sect_pr + '</w:body></w:document>'
+
+    buffer = BytesIO(skeleton)
+    with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('word/document.xml', document_xml.encode('utf-8'))
+    return buffer.getvalue()
+
+
+WRITERS = {
+    "python-docx": render_python_docx,
+    "fast": render_fast,
+}
+
+
+# Function to render note paragraphs (and fragments) to .docx bytes with the named writer
+def render_note(paragraphs, writer=None):
+    with span("serialize"):
+        return WRITERS[writer or DEFAULT_WRITER](paragraphs)
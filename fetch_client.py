@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from template_urls import API_BASE_URL, TEMPLATE_BRANCH
+
+# (connect, read) timeout in seconds for every request
+REQUEST_TIMEOUT = (3.05, 15)
+
+# Retries for connection errors and retryable statuses, with exponential backoff
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Timeout for a request that has a local copy to fall back on: one short
+# attempt, no retries, so an offline user gets the stored copy at once
+QUICK_TIMEOUT = (1.0, 5)
+
+# Parallel downloads (and pooled connections per host)
+MAX_WORKERS = 32
+
+# How long one repository tree listing is reused for folder listings
+TREE_TTL_SECONDS = 5 * 60
+
+# Optional token for the GitHub API: 5000 instead of 60 requests an hour
+GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+
+
+# Shared HTTP client: one pooled keep-alive session with timeouts and
+# bounded retries, plus parallel downloads and single-request folder listings
+class FetchClient:
+    def __init__(self, max_workers=MAX_WORKERS, timeout=REQUEST_TIMEOUT, token=GITHUB_TOKEN):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=("GET", "HEAD"),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.quick_session = requests.Session()
+        quick_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=0)
+        self.quick_session.mount("http://", quick_adapter)
+        self.quick_session.mount("https://", quick_adapter)
+        self.api_headers = {"Accept": "application/vnd.github+json"}
+        if token:
+            self.api_headers["Authorization"] = f"Bearer {token}"
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._tree = None
+        self._tree_lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    # A single attempt with a short timeout, for callers that can fall back
+    # on a stored copy (disk_cache revalidation)
+    def get_once(self, url, **kwargs):
+        kwargs.setdefault("timeout", QUICK_TIMEOUT)
+        return self.quick_session.get(url, **kwargs)
+
+    def get_api(self, url, **kwargs):
+        headers = dict(self.api_headers, **kwargs.pop("headers", {}))
+        return self.get(url, headers=headers, **kwargs)
+
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch")
+            return self._executor
+
+    # Download many URLs in parallel: {url: bytes}, or {url: exception} for failures
+    def get_many(self, urls):
+        def fetch(url):
+            try:
+                response = self.get(url)
+                response.raise_for_status()
+                return url, response.content
+            except requests.exceptions.RequestException as e:
+                return url, e
+
+        urls = list(dict.fromkeys(urls))
+        return dict(self.executor().map(fetch, urls))
+
+    # Every file path in the repository, from one recursive git tree request
+    # (instead of one contents-API call per folder); reused for TREE_TTL_SECONDS
+    def tree(self):
+        with self._tree_lock:
+            if self._tree is not None and time.monotonic() - self._tree[0] < TREE_TTL_SECONDS:
+                return self._tree[1]
+            response = self.get_api(f"{API_BASE_URL}/git/trees/{TEMPLATE_BRANCH}", params={"recursive": "1"})
+            response.raise_for_status()
+            paths = [item["path"] for item in response.json().get("tree", []) if item.get("type") == "blob"]
+            self._tree = (time.monotonic(), paths)
+            return paths
+
+    # Names of the files directly inside `folder` ("" for the repo root)
+    def list_folder(self, folder):
+        prefix = folder.strip("/") + "/" if folder.strip("/") else ""
+        names = []
+        for path in self.tree():
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                names.append(path[len(prefix):])
+        return names
+
+
+fetch_client = FetchClient()
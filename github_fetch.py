@@ -0,0 +1,50 @@
+import streamlit as st
+from docx import Document
+import requests
+from io import BytesIO
+
+from fetch_client import fetch_client
+from note_metrics import span
+from template_urls import RAW_BASE_URL
+
+# Function to list the .docx files in a folder of the repo. The listing comes
+# from one (cached) recursive tree request shared by all folders, instead of
+# a contents-API call per folder.
+def fetch_files_from_github(folder_name, fetch_diagnoses=True):
+    files = []
+    try:
+        with span("github.list"):
+            names = fetch_client.list_folder(folder_name)
+        for name in names:
+            # Filter out only .docx files, adjust for diagnosis folder
+            if name.endswith('.docx') and (fetch_diagnoses or folder_name in ["physicalexam", "ros"]):
+                files.append(name)
+    except requests.exceptions.RequestException as e:
+        st.error(f"An error occurred while fetching files: {e}")
+        st.write(str(e))  # Display the exception details for debugging
+
+    return files
+
+# Function to download and extract content from a document (for diagnosis
+# fetching). Read from TEMPLATE_BRANCH like every other template URL.
+def fetch_file_content(folder_name, file_name, fetch_diagnosis=True):
+    url = f"{RAW_BASE_URL}/{folder_name}/{file_name}"
+    
+    try:
+        # If the folder is diagnoses, proceed to fetch it
+        if fetch_diagnosis:
+            with span("template.fetch"):
+                response = fetch_client.get(url)
+            if response.status_code == 200:
+                # Parse the .docx straight from the response bytes (no temp file)
+                with span("template.parse"):
+                    doc = Document(BytesIO(response.content))
+                return doc  # Return the Document object, not just plain text
+            else:
+                st.error(f"Failed to fetch content: Status code {response.status_code}")
+                return None
+        else:
+            return None  # Return None for ROS and physical exam files if not needed
+    except requests.exceptions.RequestException as e:
+        st.error(f"An error occurred while fetching content: {e}")
+        return None
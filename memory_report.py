@@ -0,0 +1,145 @@
+# Memory diagnostics: how much each process-wide cache and each open
+# session holds, for sizing containers.
+#
+# Sizes are deep (an object plus everything it references), and anything
+# shared is counted once, against the first cache that holds it: session
+# figures are only what a session adds on top of the shared caches.
+#
+#     python memory_report.py        (warms the caches, then prints the report)
+import gc
+import os
+import sys
+import types
+import weakref
+
+# Objects that are part of the program rather than data held by a cache
+_NOT_DATA = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType, types.CodeType, types.FrameType, weakref.ref,
+)
+
+
+# Function to measure an object and everything it references, skipping
+# objects already in `seen` (which it extends)
+def deep_size(obj, seen=None):
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _NOT_DATA):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        stack.extend(gc.get_referents(item))
+    return size
+
+
+# Function to list the process-wide caches as (name, object, entry count),
+# the templates first so the caches built on top of them (fragments,
+# search indexes) are charged only for what they add
+def _caches():
+    from diagnosis_catalog import diagnosis_catalog
+    from diagnosis_index import diagnosis_index
+    from docx_writer import fragment_cache
+    from template_cache import template_cache
+    from text_index import text_index
+    from text_writer import text_fragment_cache
+
+    return [
+        ("ROS / physical exam templates", template_cache, len(template_cache)),
+        ("diagnosis templates", diagnosis_index.store, len(diagnosis_index.store.names())),
+        ("diagnosis catalog", diagnosis_catalog, len(diagnosis_catalog)),
+        ("template text index", text_index, len(text_index.doc_ids())),
+        ("docx fragments", fragment_cache, len(fragment_cache)),
+        ("text fragments", text_fragment_cache, len(text_fragment_cache)),
+    ]
+
+
+# Function to get the process's current resident memory in bytes (None
+# where /proc is not available)
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+# Function to list every open Streamlit session as (session id, state). On
+# a plain script or under AppTest there is no runtime, so only the calling
+# session's state (`current`) is listed.
+def _sessions(current=None):
+    try:
+        from streamlit.runtime import Runtime
+
+        if Runtime.exists():
+            return [
+                (info.session.id, info.session.session_state.filtered_state)
+                for info in Runtime.instance()._session_mgr.list_sessions()
+            ]
+    except Exception:
+        pass  # no runtime, or its internals moved: fall back to this session
+    return [("this session", dict(current))] if current is not None else []
+
+
+# Function to build the memory report: per-cache and per-session sizes in
+# bytes, plus the template bundle (file-backed, shared between processes)
+# and the process's resident memory
+def memory_report(current_session=None):
+    from template_bundle import default_bundle
+
+    seen = set()
+    caches = [
+        {"cache": name, "entries": entries, "bytes": deep_size(cache, seen)}
+        for name, cache, entries in _caches()
+    ]
+    sessions = [
+        {"session": session_id, "keys": len(state), "bytes": deep_size(state, set(seen))}
+        for session_id, state in _sessions(current_session)
+    ]
+    bundle = default_bundle()
+    return {
+        "caches": caches,
+        "sessions": sessions,
+        "bundle_bytes": os.path.getsize(bundle.path) if bundle is not None else 0,
+        "resident_bytes": resident_bytes(),
+    }
+
+
+# Function to show the memory report in the sidebar
+def show_memory_sidebar(st):
+    report = memory_report(st.session_state.to_dict())
+    st.sidebar.subheader("Memory")
+    if report["resident_bytes"] is not None:
+        st.sidebar.caption(f"Process: {report['resident_bytes'] / 2**20:.1f} MB resident")
+    st.sidebar.table([
+        {"cache": row["cache"], "entries": row["entries"], "KB": round(row["bytes"] / 1024, 1)}
+        for row in report["caches"]
+    ])
+    st.sidebar.caption(f"Template bundle: {report['bundle_bytes'] / 1024:.1f} KB, memory-mapped")
+    st.sidebar.table([
+        {"session": row["session"], "keys": row["keys"], "KB": round(row["bytes"] / 1024, 1)}
+        for row in report["sessions"]
+    ])
+
+
+# Function to print the memory report
+def print_report(report, out=sys.stdout):
+    for row in report["caches"]:
+        out.write(f"{row['cache']:32s} {row['entries']:6d} entries {row['bytes'] / 1024:10.1f} KB\n")
+    for row in report["sessions"]:
+        out.write(f"session {str(row['session']):24s} {row['keys']:6d} keys    {row['bytes'] / 1024:10.1f} KB\n")
+    out.write(f"{'template bundle (mapped)':32s} {report['bundle_bytes'] / 1024:25.1f} KB\n")
+    if report["resident_bytes"] is not None:
+        out.write(f"{'process resident':32s} {report['resident_bytes'] / 2**20:25.1f} MB\n")
+
+
+if __name__ == "__main__":
+    from text_index import sync_diagnoses
+    from warmup import warm_up
+
+    warm_up(background=False)
+    sync_diagnoses()
+    print_report(memory_report())
@@ -0,0 +1,253 @@
+from collections import namedtuple
+from functools import partial
+
+from diagnosis_catalog import diagnosis_catalog
+from diagnosis_index import diagnosis_index
+from docx_writer import Fragment, render_note
+from note_metrics import span
+from template_cache import get_docx
+from template_markup import (
+    compile_ros_paragraph, has_markup, heading_markup, italic_runs, legacy_heading_markup, markup_runs, parse_markup,
+    template_runs, uses_markup,
+)
+from text_writer import render_markdown, render_text
+
+# The note is built as a list of NoteParagraphs and then handed to a writer
+# (see docx_writer.py). Spacing is in points; None leaves the document
+# default. Styled paragraphs use the note font (Arial 9).
+NoteRun = namedtuple("NoteRun", ["text", "bold", "italic", "underline"], defaults=(None, None, None))
+NoteParagraph = namedtuple(
+    "NoteParagraph", ["runs", "space_before", "space_after", "styled", "line_spacing"],
+    defaults=(None, None, True, None),
+)
+
+INTRO_TEXT = "I personally examined the patient separately and discussed the case with the resident/physician assistant and with any services involved in a multidisciplinary fashion. I agree with the resident/physician's assistant documentation with any exceptions noted below:"
+
+
+# Function for a paragraph of fixed note text written in template markup
+def markup_paragraph(markup, space_before=0, space_after=0):
+    return NoteParagraph(parse_markup(markup), space_before, space_after)
+
+
+# Function for a bold, underlined section heading (e.g. "PLAN:")
+def heading(text, space_before=0, space_after=0):
+    return markup_paragraph(heading_markup(text), space_before, space_after)
+
+
+# Function for a plain note-font paragraph; like doc.add_paragraph(text),
+# an empty text gives a paragraph with no runs
+def text_paragraph(text, space_before=0, space_after=0):
+    runs = (NoteRun(text),) if text else ()
+    return NoteParagraph(runs, space_before, space_after)
+
+
+# A template section (ROS, physical exam) that is only fetched when a note is
+# actually assembled. Each source resolves its document at most once.
+class TemplateSource:
+    def __init__(self, url, loader=get_docx):
+        self.url = url
+        self._loader = loader
+        self._doc = None
+        self._loaded = False
+
+    def load(self):
+        if not self._loaded:
+            self._doc = self._loader(self.url) if self.url else None
+            self._loaded = True
+        return self._doc
+
+
+# Function to turn a section argument into a template (or None).
+# Accepts a TemplateSource, an already-loaded TemplateRecord or Document, or None.
+def resolve_section(section):
+    if isinstance(section, TemplateSource):
+        return section.load()
+    return section
+
+
+# The fixed text of a note, in template markup (see template_markup.py)
+INTRO_MARKUP = "[i]" + INTRO_TEXT + "[/i]"
+OVERNIGHT_MARKUP = "[h]OVERNIGHT EVENTS:[/h] No acute events were noted overnight."
+SUBJECTIVE_MARKUP = "[h]SUBJECTIVE: [/h]"
+OBJECTIVE_MARKUP = "[h]OBJECTIVE:[/h]"
+ASSESSMENT_MARKUP = "[h]ASSESSMENT:[/h]"
+CRITICAL_CARE_MARKUP = "[h]CLINICAL INDICATIONS FOR CRITICAL CARE SERVICES:[/h]"
+PLAN_MARKUP = "[h]PLAN:[/h]"
+
+# The same lines as create_word_doc has always written them (no final
+# period, a space inside the OBJECTIVE heading)
+PASTED_OVERNIGHT_MARKUP = "[h]OVERNIGHT EVENTS:[/h] No acute events were noted overnight"
+PASTED_OBJECTIVE_MARKUP = "[h]OBJECTIVE: [/h]"
+
+# Lines of a pasted note that start with these are section headings
+NOTE_HEADINGS = ("ASSESSMENT:", "CLINICAL INDICATIONS FOR CRITICAL CARE SERVICES:", "PLAN:")
+
+
+# Function for the attestation and OVERNIGHT EVENTS paragraphs every note starts with
+def header_paragraphs():
+    return [
+        # The introductory statement at the top (italicized, Arial, font size 9)
+        markup_paragraph(INTRO_MARKUP),
+        markup_paragraph(OVERNIGHT_MARKUP, 6, 6),
+    ]
+
+
+# Function to turn a ROS template into the SUBJECTIVE paragraphs. Each
+# template paragraph is compiled to runs the first time it is seen (as
+# markup, or by the legacy rules for a template without any), so this is
+# a loop over cached runs.
+def ros_paragraphs(ros_doc):
+    marked_up = uses_markup(para.text for para in ros_doc.paragraphs)
+    return [NoteParagraph(compile_ros_paragraph(para.text, marked_up), 0, 6) for para in ros_doc.paragraphs]
+
+
+# Function to turn template paragraphs (physical exam, diagnosis plan) into plain note paragraphs
+def plain_paragraphs(template_paragraphs):
+    return [text_paragraph(para.text) for para in template_paragraphs]
+
+
+# Function to turn a physical exam template into the OBJECTIVE paragraphs:
+# parsed as markup if the template uses any, plain paragraphs otherwise
+def physical_exam_paragraphs(template_paragraphs):
+    if not uses_markup(para.text for para in template_paragraphs):
+        return plain_paragraphs(template_paragraphs)
+    return [NoteParagraph(parse_markup(para.text), 0, 0) for para in template_paragraphs]
+
+
+# Function for the SUBJECTIVE content of a ROS template, as a Fragment
+def ros_fragment(ros_doc):
+    return Fragment(("ros", id(ros_doc)), partial(ros_paragraphs, ros_doc), ros_doc)
+
+
+# Function for the OBJECTIVE content of a physical exam template, as a Fragment
+def physical_exam_fragment(physical_exam_doc):
+    return Fragment(
+        ("physical_exam", id(physical_exam_doc)),
+        partial(physical_exam_paragraphs, physical_exam_doc.paragraphs),
+        physical_exam_doc,
+    )
+
+
+# Function for the plan paragraphs of a diagnosis template, as a Fragment
+def diagnosis_fragment(key, template):
+    return Fragment(("diagnosis", key), partial(plain_paragraphs, template), template)
+
+
+# Function to build the paragraphs of a new note. Sections that only depend
+# on a template (header, ROS, physical exam, each diagnosis plan) are added
+# as Fragments, so the writer renders each of them once and reuses it.
+def build_note(assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file, free_text_diag=None, free_text_plan=None, critical_care_time=None):
+    paragraphs = []
+
+    with span("assemble.header"):
+        paragraphs.append(Fragment(("header",), header_paragraphs))
+
+    # Resolve each template section once; sources are only fetched here
+    with span("template.resolve"):
+        ros_doc = resolve_section(ros_file)
+        physical_exam_doc = resolve_section(physical_exam_day)
+
+    # Add "SUBJECTIVE" header and ROS content
+    with span("assemble.subjective"):
+        if ros_file is not None:
+            paragraphs.append(markup_paragraph(SUBJECTIVE_MARKUP))
+
+            if ros_doc:
+                paragraphs.append(ros_fragment(ros_doc))
+
+    # Add Objective section if a physical exam day is selected
+    with span("assemble.objective"):
+        if physical_exam_day is not None:
+            paragraphs.append(markup_paragraph(OBJECTIVE_MARKUP))
+
+            # Add the fetched content under the OBJECTIVE section
+            if physical_exam_doc:
+                paragraphs.append(physical_exam_fragment(physical_exam_doc))
+
+    with span("assemble.assessment"):
+        # Add Assessment section
+        paragraphs.append(markup_paragraph(ASSESSMENT_MARKUP, space_before=6))
+        paragraphs.append(text_paragraph(assess_text, None, None))
+
+        # Add the "Why Critical Care" dropdown selection after assessment only if it's not empty
+        if critical_care_reason != "":
+            paragraphs.append(markup_paragraph(CRITICAL_CARE_MARKUP))
+            paragraphs.append(text_paragraph(critical_care_reason, None, None))
+
+    with span("assemble.plan"):
+        # Plan section
+        paragraphs.append(markup_paragraph(PLAN_MARKUP))
+
+        # Add selected diagnoses
+        for i, diagnosis in enumerate(diagnoses, start=1):
+            # Compiled once per process; no file access while building the note
+            key = diagnosis_catalog.key_for(diagnosis)
+            template = diagnosis_index.get(key)
+            if template is not None:
+                paragraphs.append(text_paragraph(f"{i}). {diagnosis}"))
+                paragraphs.append(diagnosis_fragment(key, template))
+
+        # Append free-text diagnosis and plan if provided
+        if free_text_diag and free_text_plan:
+            paragraphs.append(NoteParagraph((), styled=False))  # Add a blank line
+            paragraphs.append(NoteParagraph((NoteRun(f"Free Text Diagnosis: {free_text_diag}"),), styled=False))
+            paragraphs.append(NoteParagraph((NoteRun(f"Plan: {free_text_plan}"),), styled=False))
+
+        # Append Critical Care Time if provided
+        if critical_care_time:
+            paragraphs.append(NoteParagraph((
+                NoteRun("Critical Care Time: ", bold=True),
+                NoteRun(f"{critical_care_time}", bold=False),
+            ), 6, 6))
+
+    return paragraphs
+
+
+# Function to build a new note and render it to .docx bytes in memory
+def combine_notes(assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file, free_text_diag=None, free_text_plan=None, critical_care_time=None, writer=None):
+    paragraphs = build_note(
+        assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file,
+        free_text_diag=free_text_diag, free_text_plan=free_text_plan, critical_care_time=critical_care_time,
+    )
+    return render_note(paragraphs, writer)
+
+
+# Function to build a new note as plain text (or Markdown), with no .docx
+# built at all: for pasting into the EHR
+def combine_notes_text(assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file, free_text_diag=None, free_text_plan=None, critical_care_time=None, markdown=False):
+    paragraphs = build_note(
+        assess_text, critical_care_reason, diagnoses, physical_exam_day, ros_file,
+        free_text_diag=free_text_diag, free_text_plan=free_text_plan, critical_care_time=critical_care_time,
+    )
+    return render_markdown(paragraphs) if markdown else render_text(paragraphs)
+
+
+# Function to create a Word document with specific font settings and single spacing
+def create_word_doc(text, ros_text, physical_exam_text):
+    with span("assemble"):
+        # The introductory statement (italicized, Arial 9) and OVERNIGHT EVENTS
+        paragraphs = [
+            NoteParagraph(parse_markup(INTRO_MARKUP)),
+            NoteParagraph(parse_markup(PASTED_OVERNIGHT_MARKUP)),
+        ]
+
+        # Add ROS if selected, under a "SUBJECTIVE:" heading, in italics
+        # unless its markup says otherwise
+        if ros_text:
+            paragraphs.append(NoteParagraph(parse_markup(SUBJECTIVE_MARKUP) + italic_runs(template_runs("\n" + ros_text))))
+
+        # Add "OBJECTIVE:" directly to the same paragraph as the physical exam content
+        if has_markup(physical_exam_text):
+            physical_exam_runs = template_runs("\n" + physical_exam_text)
+        else:
+            physical_exam_runs = tuple(NoteRun("\n" + line) for line in physical_exam_text.split("\n"))
+        paragraphs.append(NoteParagraph(parse_markup(PASTED_OBJECTIVE_MARKUP) + physical_exam_runs))
+
+        # The rest of the text passed in (pasted by the user, so never read
+        # as markup), single spaced, with the section headings (lines
+        # starting with one of NOTE_HEADINGS) bold and underlined
+        for section in text.split("\n"):
+            runs = markup_runs(legacy_heading_markup(section, NOTE_HEADINGS))
+            paragraphs.append(NoteParagraph(runs, 0, 0, line_spacing=12))
+
+    return render_note(paragraphs)
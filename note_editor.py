@@ -0,0 +1,252 @@
+# Edits an existing .docx note in place, at the WordprocessingML level:
+# replacement rules and section swaps (a new SUBJECTIVE ROS, a new
+# OBJECTIVE physical exam) are applied to the uploaded document itself.
+# Only the runs a rule matches and the paragraphs of a swapped section are
+# rewritten; every other paragraph keeps its XML (and so its formatting)
+# byte for byte, and every part besides document.xml (and styles.xml, when
+# note styles have to be added) is copied over unchanged.
+import re
+import zipfile
+from io import BytesIO
+
+from docx_writer import NOTE_STYLES_XML, body_xml
+from note_builder import heading
+from note_metrics import span
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+_P = f"{{{W_NS}}}p"
+_R = f"{{{W_NS}}}r"
+_T = f"{{{W_NS}}}t"
+_TAB = f"{{{W_NS}}}tab"
+_BR = f"{{{W_NS}}}br"
+_CR = f"{{{W_NS}}}cr"
+_BODY = f"{{{W_NS}}}body"
+_SECT_PR = f"{{{W_NS}}}sectPr"
+
+# Section headings of a note, in the order build_note writes them. A
+# section runs from its heading to the next heading with another label.
+SECTION_HEADINGS = (
+    "OVERNIGHT EVENTS:",
+    "SUBJECTIVE:",
+    "OBJECTIVE:",
+    "ASSESSMENT:",
+    "CLINICAL INDICATIONS FOR CRITICAL CARE SERVICES:",
+    "PLAN:",
+)
+
+# Spacing of a heading paragraph inserted for a section the note lacks
+_INSERTED_HEADING_SPACING = {"ASSESSMENT:": (6, 0)}
+
+
+# Function to list a paragraph's text pieces in order: (node, text) where
+# node is a <w:t> (editable text) or a <w:tab/> / <w:br/> / <w:cr/>. Text
+# of paragraphs nested inside this one (text boxes) is left to them.
+def _pieces(paragraph):
+    pieces = []
+    nested = next(paragraph.iterdescendants(_P), None) is not None
+    for node in paragraph.iter(_T, _TAB, _BR, _CR):
+        if nested and next(node.iterancestors(_P)) is not paragraph:
+            continue
+        if node.tag == _T:
+            pieces.append((node, node.text or ""))
+        else:
+            pieces.append((node, "\t" if node.tag == _TAB else "\n"))
+    return pieces
+
+
+# Function to set a <w:t>'s text, keeping leading / trailing spaces
+def _set_text(node, text):
+    node.text = text
+    if text != text.strip():
+        node.set(XML_SPACE, "preserve")
+
+
+# Function to apply one replacement to a paragraph's pieces. The text goes
+# into the first <w:t> of the match (so it takes that run's formatting);
+# the matched text is cut out of any later <w:t> and tabs / breaks inside
+# the match are dropped.
+def _replace_span(pieces, offsets, start, end, replacement):
+    from lxml import etree
+
+    placed = False
+    removed = []
+    for (node, text), piece_start in zip(pieces, offsets):
+        piece_end = piece_start + len(text)
+        if piece_end <= start or piece_start >= end or not text:
+            continue
+        if node.tag != _T:
+            removed.append(node)
+            continue
+        current = node.text or ""
+        a = max(start, piece_start) - piece_start
+        b = min(end, piece_end) - piece_start
+        if not placed:
+            _set_text(node, current[:a] + replacement + current[b:])
+            placed = True
+        else:
+            _set_text(node, current[:a] + current[b:])
+    if not placed and replacement and removed:
+        # The match was only tabs / breaks: put the text where they were
+        text_node = etree.Element(_T)
+        _set_text(text_node, replacement)
+        removed[0].addprevious(text_node)
+    for node in removed:
+        node.getparent().remove(node)
+
+
+# Function to apply a compiled rule set to one paragraph, adding to the
+# per-rule counts; returns whether anything matched
+def _replace_in_paragraph(paragraph, rule_set, counts):
+    pieces = _pieces(paragraph)
+    text = "".join(piece_text for _, piece_text in pieces)
+    if not rule_set.matches(text):
+        return False
+    offsets = []
+    position = 0
+    for _, piece_text in pieces:
+        offsets.append(position)
+        position += len(piece_text)
+    # Right to left, so earlier offsets stay valid as text changes length
+    for start, end, replacement, i in reversed(list(rule_set.finditer(text))):
+        _replace_span(pieces, offsets, start, end, replacement)
+        counts[i] += 1
+    return True
+
+
+# Function to find the heading label a paragraph starts with, if any
+def _heading_label(text):
+    stripped = text.lstrip()
+    for label in SECTION_HEADINGS:
+        if stripped.startswith(label):
+            return label
+    return None
+
+
+# Function to cut everything after the heading label out of a heading
+# paragraph that also holds its section text (as create_word_doc writes
+# SUBJECTIVE and OBJECTIVE, with line breaks)
+def _truncate_after_label(paragraph, label):
+    pieces = _pieces(paragraph)
+    text = "".join(piece_text for _, piece_text in pieces)
+    end = text.index(label) + len(label)
+    # Keep a trailing space written with the label ("SUBJECTIVE: ")
+    while end < len(text) and text[end] == " ":
+        end += 1
+    if end < len(text):
+        offsets = []
+        position = 0
+        for _, piece_text in pieces:
+            offsets.append(position)
+            position += len(piece_text)
+        _replace_span(pieces, offsets, end, len(text), "")
+    # Drop runs left with nothing in them
+    for run in list(paragraph.iterchildren(_R)):
+        if not any(True for _ in run.iter(_T, _TAB, _BR, _CR)):
+            paragraph.remove(run)
+
+
+# Function to render note items (paragraphs and Fragments) into <w:p>
+# elements; Fragments reuse the XML cached by the fast writer
+def _render_items(items):
+    from lxml import etree
+
+    wrapper = etree.fromstring(f'<w:body xmlns:w="{W_NS}">{body_xml(items)}</w:body>')
+    return list(wrapper)
+
+
+# Function to replace the content of one section with new note items,
+# adding the heading (before the next section present) if the note has none
+def _swap_section(body, label, items):
+    blocks = [child for child in body if child.tag != _SECT_PR]
+    labels = [_heading_label("".join(text for _, text in _pieces(block))) if block.tag == _P else None for block in blocks]
+
+    if label in labels:
+        start = labels.index(label)
+        end = start + 1
+        while end < len(blocks) and labels[end] in (None, label):
+            end += 1
+        _truncate_after_label(blocks[start], label)
+        for block in blocks[start + 1:end]:
+            body.remove(block)
+        anchor = blocks[start]
+        new_blocks = _render_items(items)
+    else:
+        order = SECTION_HEADINGS.index(label)
+        later = [i for i, found in enumerate(labels) if found and SECTION_HEADINGS.index(found) > order]
+        space_before, space_after = _INSERTED_HEADING_SPACING.get(label, (0, 0))
+        new_blocks = _render_items([heading(label, space_before, space_after)] + list(items))
+        if later:
+            anchor = blocks[later[0]]
+            for block in new_blocks:
+                anchor.addprevious(block)
+            return
+        anchor = blocks[-1] if blocks else None
+        if anchor is None:
+            for block in reversed(new_blocks):
+                body.insert(0, block)
+            return
+    for block in reversed(new_blocks):
+        anchor.addnext(block)
+
+
+# Function to add the note styles to a styles part that lacks them, so
+# swapped-in sections keep the note font
+def _with_note_styles(styles_xml):
+    text = styles_xml.decode("utf-8")
+    if 'w:styleId="NoteText"' in text:
+        return None
+    return re.sub(r"</w:styles>\s*$", lambda _: NOTE_STYLES_XML + "</w:styles>", text).encode("utf-8")
+
+
+# Function to edit an existing note: apply a compiled RuleSet (or None) to
+# every paragraph, then replace the sections in `sections`, a mapping of
+# heading label (see SECTION_HEADINGS) to note items. Returns the edited
+# .docx bytes and the replacements made per rule; raises ValueError if
+# `data` is not a Word document.
+def edit_note(data, rule_set=None, sections=None):
+    from lxml import etree
+
+    counts = [0] * len(rule_set.rules) if rule_set is not None else []
+    with span("edit.parse"):
+        try:
+            source = zipfile.ZipFile(BytesIO(data))
+            document = etree.fromstring(source.read("word/document.xml"))
+        except zipfile.BadZipFile:
+            raise ValueError("the file is not a .docx document") from None
+        except KeyError:
+            raise ValueError("the .docx has no word/document.xml") from None
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f"the .docx document is damaged: {e}") from None
+        body = document.find(_BODY)
+        if body is None:
+            raise ValueError("the .docx document has no body")
+
+    changed = False
+    if rule_set is not None:
+        with span("edit.replace"):
+            for paragraph in document.iter(_P):
+                changed = _replace_in_paragraph(paragraph, rule_set, counts) or changed
+
+    new_parts = {}
+    if sections:
+        with span("edit.sections"):
+            for label, items in sections.items():
+                _swap_section(body, label, items)
+            if "word/styles.xml" in source.namelist():
+                styles = _with_note_styles(source.read("word/styles.xml"))
+                if styles is not None:
+                    new_parts["word/styles.xml"] = styles
+        changed = True
+
+    if not changed:
+        return data, counts
+
+    with span("serialize"):
+        new_parts["word/document.xml"] = etree.tostring(document, xml_declaration=True, encoding="UTF-8", standalone=True)
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package:
+            for info in source.infolist():
+                package.writestr(info, new_parts.get(info.filename) or source.read(info))
+    return buffer.getvalue(), counts
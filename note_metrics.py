@@ -0,0 +1,192 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# How many recent samples per stage the rolling percentiles are computed over
+WINDOW_SIZE = 1000
+
+# Quantiles exported for every stage
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Optional exports, configured through the environment:
+#   S_CHAR_METRICS_FILE  path of a Prometheus text file (node_exporter textfile collector)
+#   S_CHAR_METRICS_PORT  port of a /metrics endpoint started inside the app process
+#   S_CHAR_METRICS_HOST  address that endpoint listens on (default 127.0.0.1,
+#                        this host only; 0.0.0.0 exposes it on every interface)
+METRICS_FILE = os.environ.get("S_CHAR_METRICS_FILE")
+METRICS_PORT = os.environ.get("S_CHAR_METRICS_PORT")
+METRICS_HOST = os.environ.get("S_CHAR_METRICS_HOST", "127.0.0.1")
+
+# Minimum seconds between two writes of the metrics file
+FILE_EXPORT_INTERVAL = 5.0
+
+
+# Rolling per-stage timings shared by every session in the process
+class StageTimings:
+    def __init__(self, window=WINDOW_SIZE):
+        self.window = window
+        self._samples = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+
+    # {stage: {"count", "sum", 0.5: .., 0.95: .., 0.99: ..}} in seconds
+    def summary(self):
+        with self._lock:
+            snapshot = {stage: (sorted(samples), tuple(self._totals[stage])) for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, (samples, (count, total)) in sorted(snapshot.items()):
+            entry = {"count": count, "sum": total}
+            for q in QUANTILES:
+                entry[q] = samples[min(len(samples) - 1, int(q * len(samples)))]
+            summary[stage] = entry
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+
+stage_timings = StageTimings()
+
+# Spans recorded during the current Streamlit rerun (or request), if one is being traced
+_current_trace = contextvars.ContextVar("s_char_trace", default=None)
+
+
+# Collects the (stage, seconds) spans of one rerun so they can be shown to the user
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.started_at = time.perf_counter()
+        self.total = None
+        self._token = _current_trace.set(self)
+
+    # Stop the trace, record its total as the `name` stage, and return the total
+    def finish(self):
+        if self.total is None:
+            self.total = time.perf_counter() - self.started_at
+            stage_timings.record(self.name, self.total)
+            _current_trace.reset(self._token)
+        return self.total
+
+
+def start_trace(name):
+    return Trace(name)
+
+
+# Time a block as `stage`: recorded in the rolling stats and in the active trace
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_timings.record(stage, elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+
+# Function to render the rolling stats in the Prometheus text exposition format
+def prometheus_text(timings=stage_timings):
+    lines = [
+        "# HELP s_char_stage_seconds Time spent in each stage of note generation.",
+        "# TYPE s_char_stage_seconds summary",
+    ]
+    for stage, entry in timings.summary().items():
+        for q in QUANTILES:
+            lines.append(f's_char_stage_seconds{{stage="{stage}",quantile="{q}"}} {entry[q]:.6f}')
+        lines.append(f's_char_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+        lines.append(f's_char_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+# Function to write the metrics file atomically, so a scraper never reads half a file
+def write_prometheus_file(path, timings=stage_timings):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text(timings))
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+_last_file_export = 0.0
+
+
+# Function to start the /metrics endpoint once per process
+def start_metrics_server(port, host=METRICS_HOST):
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+# Function called at the end of each rerun: serve / write the metrics if configured
+def export_metrics():
+    global _last_file_export
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT)
+        except OSError:
+            pass  # another process on this host already serves the port
+    if METRICS_FILE and time.monotonic() - _last_file_export > FILE_EXPORT_INTERVAL:
+        _last_file_export = time.monotonic()
+        write_prometheus_file(METRICS_FILE)
+
+
+# Function to show this rerun's spans and the rolling percentiles in the sidebar
+def show_timings_sidebar(st, trace):
+    st.sidebar.subheader("Timings")
+    st.sidebar.caption(f"This run: {trace.total * 1000:.1f} ms total")
+    if trace.spans:
+        st.sidebar.table([{"stage": stage, "ms": round(seconds * 1000, 2)} for stage, seconds in trace.spans])
+    rows = [
+        {
+            "stage": stage,
+            "n": entry["count"],
+            "p50 ms": round(entry[0.5] * 1000, 2),
+            "p95 ms": round(entry[0.95] * 1000, 2),
+            "p99 ms": round(entry[0.99] * 1000, 2),
+        }
+        for stage, entry in stage_timings.summary().items()
+    ]
+    st.sidebar.caption("Rolling percentiles (this process)")
+    st.sidebar.table(rows)
@@ -0,0 +1,280 @@
+# Headless JSON API for note generation, for EHR-side scripts.
+#
+#     python note_server.py [--port 8502] [--workers 4] [--queue 32] [--local-templates]
+#
+#     POST /notes     a note spec as JSON (the batch_notes.py census fields:
+#                     room, diagnoses, assessment, ros, physical_exam or
+#                     exam_age + exam_day, critical_care_reason,
+#                     critical_care_time); returns the .docx
+#     GET  /health    pool and queue state as JSON
+#     GET  /metrics   request timings in the Prometheus text format
+#
+#     curl -s localhost:8502/notes -o 12.docx -d '{"room": "12",
+#          "diagnoses": ["Sepsis"], "assessment": "Stable.",
+#          "ros": "ROS_RN", "physical_exam": "Infant Day 2"}'
+#
+# Notes are rendered by batch_notes.render_entry (combine_notes) on a pool
+# of worker processes, each of which loads the diagnosis index and every
+# ROS / physical exam template once when it starts. A request holds one of
+# `workers + queue` slots from the moment it is accepted until its note is
+# rendered, so up to `queue` requests wait for a free worker; past that the
+# server answers 503 with Retry-After at once instead of letting the
+# backlog grow. A note that takes longer than --timeout gets a 504 (its
+# slot is freed once the worker finishes). Specs are checked before they
+# take a slot (field types, known ROS / exam selections, and a template for
+# every diagnosis), so a bad spec is a 400 that costs no worker time.
+#
+# The server listens on 127.0.0.1 by default and needs nothing but the
+# templates (GitHub, the shared disk cache, or --local-templates).
+# benchmarks/api_load_test.py drives it with concurrent clients.
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_notes import init_worker, normalize_entry, note_file_name, render_entry, validate_entry
+from note_metrics import prometheus_text, span
+from template_urls import physical_exam_files, physical_exam_paths, ros_files, ros_paths
+
+DEFAULT_PORT = 8502
+
+# Worker processes, requests allowed to wait for one, and seconds a
+# request may take before it gets a 504
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+DEFAULT_QUEUE = 32
+RENDER_TIMEOUT_SECONDS = 30
+
+# Largest accepted request body
+MAX_BODY_BYTES = 1 << 20
+
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_SECONDS = 1
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+# Function run when a worker process starts: Ctrl-C is left to the server,
+# which shuts the pool down, then the worker warms its caches
+def _init_server_worker(local_templates, template_keys):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(local_templates, template_keys)
+
+
+# Function submitted once per worker by warm_up: nothing to do, it only
+# makes the pool start (and so warm) its workers
+def _ready():
+    return os.getpid()
+
+
+# The worker pool behind the API: renders note specs with bounded
+# concurrency and a bounded queue, and counts what happened to each request
+class NoteService:
+    def __init__(self, workers=DEFAULT_WORKERS, queue=DEFAULT_QUEUE, local_templates=False, timeout=RENDER_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.queue = queue
+        self.local_templates = local_templates
+        self.timeout = timeout
+        paths = (ros_paths, physical_exam_paths) if local_templates else (ros_files, physical_exam_files)
+        template_keys = sorted(key for table in paths for key in table.values())
+        # Spawned, not forked: the server's threads are not copied into the workers
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_server_worker, initargs=(local_templates, template_keys),
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    # Function to start every worker and wait until their caches are warm
+    def warm_up(self):
+        for future in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def _count(self, counter, delta=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+
+    def _release(self, future):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    # Function to render one note spec (a dict). Returns (HTTP status,
+    # payload): the .docx bytes on 200, an error message otherwise.
+    def render(self, spec):
+        try:
+            entry = normalize_entry(spec)
+            validate_entry(entry, self.local_templates)
+        except ValueError as e:
+            self._count("invalid")
+            return 400, str(e)
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            return 503, "server busy, retry later"
+        self._count("accepted")
+        self._count("in_flight")
+        try:
+            future = self.pool.submit(render_entry, entry, self.local_templates)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            with span("api.render"):
+                _, data, error = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count("timed_out")
+            return 504, f"note not rendered within {self.timeout:g} s"
+        except Exception as e:  # the pool itself failed (a worker died)
+            self._count("failed")
+            return 500, f"{type(e).__name__}: {e}"
+        if error is not None:
+            self._count("failed")
+            return 500, error
+        self._count("completed")
+        return 200, data
+
+    def health(self):
+        with self._lock:
+            return {
+                "status": "ok",
+                "workers": self.workers,
+                "queue": self.queue,
+                "in_flight": self.in_flight,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "invalid": self.invalid,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+            }
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _NoteHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client sending many notes keeps its connection; the
+    # headers and body go out as separate writes, so Nagle is off
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=()):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/health":
+            self._send_json(200, self.server.service.health())
+        elif path == "/metrics":
+            self._send(200, prometheus_text().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Where the body ends is unknown, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(400, {"error": "invalid Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {"error": "request body too large"})
+            return
+        body = self.rfile.read(length)
+        if self.path.split("?")[0] != "/notes":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            spec = json.loads(body or b"null")
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+        if not isinstance(spec, dict):
+            self._send_json(400, {"error": "expected a JSON object"})
+            return
+
+        with span("api.request"):
+            status, payload = self.server.service.render(spec)
+        if status == 200:
+            file_name = note_file_name(str(spec.get("room", "")), set())
+            self._send(200, payload, DOCX_TYPE, [("Content-Disposition", f'attachment; filename="{file_name}"')])
+        elif status == 503:
+            self._send_json(503, {"error": payload}, [("Retry-After", str(RETRY_AFTER_SECONDS))])
+        else:
+            self._send_json(status, {"error": payload})
+
+
+class _NoteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections waiting to be accepted: a burst of clients is answered
+    # (with a note or a 503) instead of timing out in the listen backlog
+    request_queue_size = 128
+
+
+# Function to create (not start) the HTTP server for `service`; port 0
+# picks a free port (see server.server_address)
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    server = _NoteServer((host, port), _NoteHandler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve note generation as a local JSON API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker processes rendering notes")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE, help="requests allowed to wait for a worker")
+    parser.add_argument("--timeout", type=float, default=RENDER_TIMEOUT_SECONDS, help="seconds before a request gets a 504")
+    parser.add_argument("--local-templates", action="store_true",
+                        help="read ROS / physical exam templates from this checkout instead of GitHub")
+    args = parser.parse_args(argv)
+
+    service = NoteService(args.workers, args.queue, args.local_templates, args.timeout)
+    start = time.perf_counter()
+    service.warm_up()
+    server = make_server(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"{args.workers} workers warm in {time.perf_counter() - start:.1f} s; serving on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
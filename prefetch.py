@@ -0,0 +1,275 @@
+# Background prefetch of the templates a clinician is likely to need next.
+#
+# While the form is being filled in, prefetcher.prefetch() is given the
+# current selections and queues, on a small thread pool, whatever of these
+# is not warm yet:
+#
+#   - the selected ROS and the other real ROS files (nearly every note uses
+#     one of the two)
+#   - the selected physical exam and its neighbours for the same age group,
+#     nearest day first (Day 3 tomorrow, another day for the next bed),
+#     then the exams used most in recent notes
+#   - the fragments of the selected diagnoses and of the diagnoses used most
+#     in recent notes
+#
+# Templates go into the template cache and their rendered XML into the
+# fragment cache, so the submit finds both warm. Nothing here blocks the
+# rerun: prefetch() only queues work, at most PREFETCH_MAX_PENDING items
+# are queued or running at once (the rest are dropped, not delayed), and
+# PREFETCH_WORKERS threads do the loading.
+#
+# record_use() is called at submit with what the note actually uses: an
+# item the prefetcher loaded counts as a hit, an item that still had to be
+# loaded on demand as a miss (items that were already warm count as
+# neither). An item only counts as prefetched if it was still cold when the
+# prefetch thread finished loading it and no note had asked for it in the
+# meantime, so work done by the on-demand path is never credited to the
+# prefetcher. Set S_CHAR_PREFETCH=0 to turn prefetching off for the process.
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+PREFETCH_ENABLED = os.environ.get("S_CHAR_PREFETCH", "1") != "0"
+
+# Loader threads, and items queued or running at once
+PREFETCH_WORKERS = 2
+PREFETCH_MAX_PENDING = 16
+
+# How many neighbouring exams and recently used diagnoses to prefetch
+PREFETCH_EXAMS = 4
+PREFETCH_DIAGNOSES = 8
+
+# Notes remembered for "recent usage", and prefetched items remembered
+# while waiting to be used
+RECENT_NOTES = 50
+MAX_TRACKED = 256
+
+_EXAM_LABEL = re.compile(r"^(.*) Day (\d+)$")
+
+
+# Function to list the physical exam labels likely to follow `selected`:
+# the selection itself, then the same age group's other days nearest first
+# (the next day before the previous one), then the most used recent exams
+def likely_exams(selected, labels, recent=(), limit=PREFETCH_EXAMS):
+    exams = [selected] if selected in labels else []
+    match = _EXAM_LABEL.match(selected or "")
+    if match:
+        age, day = match.group(1), int(match.group(2))
+        same_age = [
+            (abs(int(m.group(2)) - day), int(m.group(2)) < day, label)
+            for label, m in ((label, _EXAM_LABEL.match(label)) for label in labels)
+            if m and m.group(1) == age and label != selected
+        ]
+        exams += [label for _, _, label in sorted(same_age)][:limit]
+    for label in recent:
+        if label in labels and label not in exams:
+            exams.append(label)
+    return exams
+
+
+# Thread pool that warms the template and fragment caches ahead of a note,
+# with hit-rate accounting. One instance is shared by every session.
+class Prefetcher:
+    def __init__(self, workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING, enabled=PREFETCH_ENABLED):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._prefetched = OrderedDict()
+        # Pending items a note asked for before they finished loading
+        self._claimed = set()
+        self._recent = deque(maxlen=RECENT_NOTES)
+        self.issued = 0
+        self.loaded = 0
+        self.failed = 0
+        self.dropped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        return self._executor
+
+    # Queue `load` under `item` unless it is already warm, already queued,
+    # or the cap is reached; `load()` returns True when it actually loaded
+    # something
+    def _submit(self, item, load):
+        if _is_warm(item):
+            return False
+        with self._lock:
+            if item in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.add(item)
+            self.issued += 1
+            self._pool().submit(self._run, item, load)
+        return True
+
+    def _run(self, item, load):
+        try:
+            loaded = load()
+        except Exception:
+            loaded = False  # offline or a bad template: the note loads it on demand
+            with self._lock:
+                self.failed += 1
+        with self._lock:
+            self._pending.discard(item)
+            if item in self._claimed:
+                self._claimed.discard(item)
+                loaded = False  # the note loaded it itself meanwhile
+            if loaded:
+                self.loaded += 1
+                self._prefetched[item] = True
+                while len(self._prefetched) > MAX_TRACKED:
+                    self._prefetched.popitem(last=False)
+
+    # Function to queue the likely-next templates for these selections
+    # (labels from template_urls, diagnosis names as displayed)
+    def prefetch(self, ros_label, exam_label, diagnoses=()):
+        if not self.enabled:
+            return 0
+        from template_urls import physical_exam_files, ros_files
+
+        with self._lock:
+            recent_exams = [label for label, _ in Counter(note[1] for note in self._recent).most_common()]
+            recent_diagnoses = [key for key, _ in Counter(key for note in self._recent for key in note[2]).most_common(PREFETCH_DIAGNOSES)]
+
+        ros_labels = [ros_label] + [label for label in ros_files if label not in ("None", ros_label)]
+        queued = 0
+        for label in ros_labels:
+            if label in ros_files:
+                queued += self._submit(("template", ros_files[label]), lambda url=ros_files[label]: _load_template(url, "ros"))
+        for label in likely_exams(exam_label, list(physical_exam_files), recent_exams):
+            url = physical_exam_files[label]
+            queued += self._submit(("template", url), lambda url=url: _load_template(url, "physical_exam"))
+        keys = list(dict.fromkeys([_diagnosis_key(name) for name in diagnoses] + recent_diagnoses))
+        for key in keys:
+            queued += self._submit(("diagnosis", key), lambda key=key: _load_diagnosis(key))
+        return queued
+
+    # Function to record what a note uses, for the hit rate and for recent
+    # usage. Call it before the note is built, while a miss is still cold.
+    def record_use(self, ros_label, exam_label, diagnoses=()):
+        if not self.enabled:
+            return
+        from template_urls import physical_exam_files, ros_files
+
+        keys = tuple(_diagnosis_key(name) for name in diagnoses)
+        items = [("template", url) for url in (ros_files.get(ros_label), physical_exam_files.get(exam_label)) if url]
+        items += [("diagnosis", key) for key in keys]
+        warm = {item: _is_warm(item) for item in items}
+        with self._lock:
+            self._recent.append((ros_label, exam_label, keys))
+            for item in items:
+                if self._prefetched.pop(item, None):
+                    self.hits += 1
+                elif item in self._pending:
+                    self.misses += 1
+                    self._claimed.add(item)
+                elif not warm[item]:
+                    self.misses += 1
+
+    def hit_rate(self):
+        used = self.hits + self.misses
+        return self.hits / used if used else None
+
+    def summary(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "issued": self.issued,
+                "loaded": self.loaded,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+            }
+
+    # Function to wait for everything queued so far (tests and benchmarks)
+    def drain(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+prefetcher = Prefetcher()
+
+
+def _diagnosis_key(name):
+    from diagnosis_catalog import diagnosis_catalog
+
+    return diagnosis_catalog.key_for(name)
+
+
+# Function to load a ROS / physical exam template and render its fragment.
+# False when the template turned out to be warm, including when a note
+# loaded it while this was downloading (its copy is kept).
+def _load_template(url, kind):
+    from docx_writer import warm_fragments
+    from note_builder import physical_exam_fragment, ros_fragment
+    from template_cache import fetch_docx, template_cache
+
+    if template_cache.contains(url):
+        return False
+    doc = fetch_docx(url)
+    if template_cache.contains(url):
+        return False
+    template_cache.put(url, doc)
+    if doc:
+        warm_fragments([ros_fragment(doc) if kind == "ros" else physical_exam_fragment(doc)])
+    return True
+
+
+# Function to render a diagnosis's plan fragment; False when it was warm
+def _load_diagnosis(key):
+    from diagnosis_index import diagnosis_index
+    from docx_writer import warm_fragments
+    from note_builder import diagnosis_fragment
+
+    if _is_warm(("diagnosis", key)):
+        return False
+    template = diagnosis_index.get(key)
+    if template is None:
+        return False
+    warm_fragments([diagnosis_fragment(key, template)])
+    return True
+
+
+# Function to check whether a prefetch item is in its cache, without
+# touching the cache's own hit / miss counts
+def _is_warm(item):
+    kind, key = item
+    if kind == "template":
+        from template_cache import template_cache
+
+        return template_cache.contains(key)
+    from diagnosis_index import diagnosis_index
+    from docx_writer import fragment_cache
+
+    cached = fragment_cache.peek(("diagnosis", key))
+    return cached is not None and cached[0] is diagnosis_index.get(key)
+
+
+# Function to show the prefetcher's counters in the sidebar
+def show_prefetch_sidebar(st):
+    summary = prefetcher.summary()
+    st.sidebar.subheader("Prefetch")
+    if not summary["enabled"]:
+        st.sidebar.caption("Off (S_CHAR_PREFETCH=0)")
+        return
+    hit_rate = "n/a" if summary["hit_rate"] is None else f"{summary['hit_rate']:.0%}"
+    st.sidebar.caption(
+        f"Hit rate {hit_rate} ({summary['hits']} hits, {summary['misses']} misses); "
+        f"{summary['loaded']} loaded, {summary['dropped']} dropped, {summary['pending']} pending"
+    )
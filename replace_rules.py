@@ -0,0 +1,229 @@
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from note_metrics import span
+
+# Where the update page keeps its rule set (shared by everyone using this checkout)
+RULES_FILE = os.environ.get(
+    "S_CHAR_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "replace_rules.json")
+)
+
+# One replacement rule. `find` is literal text unless `regex` is set, in which
+# case `replace` may use \1 / \g<name> for the rule's own groups.
+Rule = namedtuple(
+    "Rule", ["find", "replace", "whole_word", "ignore_case", "regex", "enabled"],
+    defaults=(False, False, False, True),
+)
+
+# Columns of the rule editor, in order
+RULE_FIELDS = Rule._fields
+
+
+# Function to read the saved rule set (an empty list when none was saved yet)
+def load_rules(path=RULES_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    except FileNotFoundError:
+        return []
+    return [rule_from_row(row) for row in rows]
+
+
+# Function to save a rule set, replacing the file atomically
+def save_rules(rules, path=RULES_FILE):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([rule._asdict() for rule in rules], f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# Function to build a Rule from an editor row or JSON object, tolerating
+# blank cells
+def rule_from_row(row):
+    return Rule(
+        find=str(row.get("find") or ""),
+        replace=str(row.get("replace") or ""),
+        whole_word=bool(row.get("whole_word")),
+        ignore_case=bool(row.get("ignore_case")),
+        regex=bool(row.get("regex")),
+        enabled=row.get("enabled") is not False,
+    )
+
+
+# Function to build one regular expression matching any of `words`, shaped
+# as a trie ("ab(?:c|d)" rather than "abc|abd") so the engine follows a
+# single branch per character instead of trying every word at every
+# position; greedy optional tails make the longest word win
+def _trie_pattern(words):
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:%s)" % "|".join(branches)
+        return "(?:%s)?" % body if "" in node else body
+
+    return build(root)
+
+
+# Global inline flags at the start of a rule ("(?i)...") and named groups
+_GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+_NAMED_GROUP = re.compile(r"(?<!\\)((?:\\\\)*)\(\?P<\w+>")
+
+
+# Function to turn a regex rule into its regular expression source. Leading
+# global flags become a scoped group, since the rule ends up in the middle
+# of the combined pattern, where global flags are not allowed.
+def _rule_pattern(rule):
+    pattern = rule.find
+    flags = _GLOBAL_FLAGS.match(pattern)
+    if flags:
+        unscoped = set(flags.group(1)) - set("imsx")
+        if unscoped:
+            raise ValueError(f"({rule.find!r}): inline flag {''.join(sorted(unscoped))!r} is not supported")
+        pattern = "(?%s:%s)" % (flags.group(1), pattern[flags.end():])
+    if rule.whole_word:
+        pattern = r"(?<!\w)(?:%s)(?!\w)" % pattern
+    if rule.ignore_case:
+        pattern = "(?i:%s)" % pattern
+    return pattern
+
+
+# A rule set compiled into one regular expression, so every rule is applied
+# in a single left-to-right pass over the text: nothing a rule writes is
+# rescanned by another rule, and the note is read once however many rules
+# there are. Literal rules are folded into up to four tries (by whole-word
+# and ignore-case) and looked up by the text they matched; regex rules follow
+# as named groups. Where several rules match at the same spot, case-sensitive
+# literals come before case-insensitive ones, the longer literal wins within
+# each, and regex rules are tried last, in order. A literal listed twice
+# keeps its first rule.
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        literal_groups = {}
+        regexes = []
+        for i, rule in enumerate(self.rules):
+            if not (rule.enabled and rule.find):
+                continue
+            if rule.regex:
+                regexes.append(i)
+            else:
+                table = literal_groups.setdefault((rule.ignore_case, not rule.whole_word), {})
+                table.setdefault(rule.find.lower() if rule.ignore_case else rule.find, i)
+
+        alternatives = []
+        first_chars = set()
+        self._literals = {}
+        for n, ((ignore_case, partial), table) in enumerate(sorted(literal_groups.items())):
+            pattern = _trie_pattern(table)
+            if not partial:
+                pattern = r"(?<!\w)%s(?!\w)" % pattern
+            if ignore_case:
+                pattern = "(?i:%s)" % pattern
+                first_chars.update(c for word in table for c in (word[0], word[0].upper()))
+            else:
+                first_chars.update(word[0] for word in table)
+            alternatives.append(f"(?P<_lit{n}>{pattern})")
+            self._literals[f"_lit{n}"] = (table, ignore_case)
+        if alternatives:
+            # Checking the next character against every literal's first one
+            # lets the scan skip most positions without entering the tries
+            lookahead = "".join(re.escape(c) for c in sorted(first_chars))
+            alternatives = ["(?=[%s])(?:%s)" % (lookahead, "|".join(alternatives))]
+
+        self._own_patterns = {}
+        for i in regexes:
+            rule = self.rules[i]
+            if re.search(r"\\[1-9]|\(\?P=", rule.find):
+                # Group numbers shift once the rules are joined into one pattern
+                raise ValueError(f"rule {i + 1} ({rule.find!r}): backreferences are not supported")
+            try:
+                pattern = _rule_pattern(rule)
+                compiled = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"rule {i + 1} ({rule.find!r}): {e}") from None
+            except ValueError as e:
+                raise ValueError(f"rule {i + 1} {e}") from None
+            if compiled.match(""):
+                raise ValueError(f"rule {i + 1} ({rule.find!r}) matches empty text")
+            self._own_patterns[f"_rule{i}"] = (i, compiled)
+            # The rule's own pattern expands \g<name>; in the combined one its
+            # named groups are plain groups, so two rules may use one name
+            anonymous = _NAMED_GROUP.sub(r"\1(?:", pattern)
+            alternatives.append(f"(?P<_rule{i}>{anonymous})")
+        try:
+            self._matcher = re.compile("|".join(alternatives)) if alternatives else None
+        except re.error as e:
+            raise ValueError(f"the rules cannot be combined: {e}") from None
+
+    # Apply every rule in one pass: returns (new text, replacements per rule),
+    # the counts listed in the same order as the rules
+    def apply(self, text):
+        counts = [0] * len(self.rules)
+        if self._matcher is None or not text:
+            return text, counts
+        rules = self.rules
+        literals = self._literals
+        own_patterns = self._own_patterns
+
+        def substitute(match):
+            group = match.lastgroup
+            literal = literals.get(group)
+            if literal is not None:
+                table, ignore_case = literal
+                found = match.group()
+                i = table.get(found.lower() if ignore_case else found)
+                if i is None:
+                    return found  # case folding that lower() does not mirror
+                counts[i] += 1
+                return rules[i].replace
+            i, own = own_patterns[group]
+            counts[i] += 1
+            # Expand the replacement against the rule's own groups
+            return own.match(match.string, match.start()).expand(rules[i].replace)
+
+        with span("replace.apply"):
+            return self._matcher.sub(substitute, text), counts
+
+    # The replacements apply() would make, without making them: yields
+    # (start, end, replacement, rule index) left to right
+    def finditer(self, text):
+        if self._matcher is None or not text:
+            return
+        for match in self._matcher.finditer(text):
+            group = match.lastgroup
+            literal = self._literals.get(group)
+            if literal is not None:
+                table, ignore_case = literal
+                found = match.group()
+                i = table.get(found.lower() if ignore_case else found)
+                if i is not None:
+                    yield match.start(), match.end(), self.rules[i].replace, i
+                continue
+            i, own = self._own_patterns[group]
+            yield match.start(), match.end(), own.match(text, match.start()).expand(self.rules[i].replace), i
+
+    # Cheap check for whether apply() would change anything in `text`
+    def matches(self, text):
+        return self._matcher is not None and self._matcher.search(text) is not None
+
+
+# Function to compile a rule set once and reuse it while the rules are unchanged
+@lru_cache(maxsize=32)
+def compile_rules(rules):
+    return RuleSet(rules)
+
+
+# Function to apply a rule set to a note: (new text, replacements per rule)
+def apply_rules(text, rules):
+    return compile_rules(tuple(rules)).apply(text)
@@ -0,0 +1,311 @@
+# Packs every diagnosis, ros/ and physicalexam/ template into one bundle
+# file of compiled paragraphs, so the app can read templates by slicing a
+# memory map instead of inflating ~100 .docx zips and parsing their XML.
+#
+#     python template_bundle.py build [-o templates.bundle]
+#     python template_bundle.py report
+#
+# Layout (little-endian):
+#   header   magic "SCTB", format version (u16), flags (u16), entry count (u32),
+#            SHA-256 over all entries (32 bytes)
+#   table    per entry: name length (u16), name (UTF-8, repo-relative path),
+#            SHA-256 of the source .docx (32 bytes), record offset (u32),
+#            record length (u32)
+#   records  paragraph count (u16), then per paragraph: text length (u32),
+#            run count (u16), joined flag (u8), text; then per run:
+#            bold/italic (u8), underline (u8), text length (u32) and, unless
+#            the runs join up to the paragraph text, the run text
+#
+# Records are content-addressed: templates with identical bytes share one.
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from diagnosis_index import TEMPLATE_DIR, RunSpec, TemplateRecord, compile_document, paragraph_spec
+
+MAGIC = b"SCTB"
+FORMAT_VERSION = 1
+BUNDLE_PATH = os.environ.get("S_CHAR_TEMPLATE_BUNDLE", os.path.join(TEMPLATE_DIR, "templates.bundle"))
+
+# Folders packed besides the top-level diagnosis templates
+TEMPLATE_FOLDERS = ("ros", "physicalexam")
+
+_HEADER = struct.Struct("<4sHHI32s")
+_ENTRY = struct.Struct("<32sII")
+_U16 = struct.Struct("<H")
+_PARAGRAPH = struct.Struct("<IHB")
+_RUN = struct.Struct("<BBI")
+
+# Tri-state run properties (None / False / True) in two bits each
+_TRISTATE = {None: 0, False: 1, True: 2}
+_FROM_TRISTATE = (None, False, True)
+
+
+def _encode_underline(value):
+    if value in _TRISTATE:
+        return _TRISTATE[value]
+    return 3 + int(value)  # a WD_UNDERLINE style (double, dotted, ...)
+
+
+def _decode_underline(value):
+    if value < 3:
+        return _FROM_TRISTATE[value]
+    from docx.enum.text import WD_UNDERLINE
+    return WD_UNDERLINE(value - 3)
+
+
+# Function to encode compiled paragraphs as one bundle record
+def encode_record(paragraphs):
+    out = [_U16.pack(len(paragraphs))]
+    for para in paragraphs:
+        text = para.text.encode("utf-8")
+        joined = "".join(run.text for run in para.runs) == para.text
+        out.append(_PARAGRAPH.pack(len(text), len(para.runs), joined))
+        out.append(text)
+        for run in para.runs:
+            run_text = run.text.encode("utf-8")
+            flags = _TRISTATE[run.bold] | (_TRISTATE[run.italic] << 2)
+            out.append(_RUN.pack(flags, _encode_underline(run.underline), len(run_text)))
+            if not joined:
+                out.append(run_text)
+    return b"".join(out)
+
+
+# Function to decode one record from `buffer` at `offset`
+def decode_record(buffer, offset):
+    (count,) = _U16.unpack_from(buffer, offset)
+    offset += _U16.size
+    paragraphs = []
+    for _ in range(count):
+        text_length, run_count, joined = _PARAGRAPH.unpack_from(buffer, offset)
+        offset += _PARAGRAPH.size
+        text_bytes = buffer[offset:offset + text_length]
+        offset += text_length
+        runs = []
+        run_start = 0
+        for _ in range(run_count):
+            flags, underline, run_length = _RUN.unpack_from(buffer, offset)
+            offset += _RUN.size
+            if joined:
+                run_text = text_bytes[run_start:run_start + run_length]
+                run_start += run_length
+            else:
+                run_text = buffer[offset:offset + run_length]
+                offset += run_length
+            runs.append(RunSpec(
+                run_text.decode("utf-8"),
+                _FROM_TRISTATE[flags & 3], _FROM_TRISTATE[(flags >> 2) & 3],
+                _decode_underline(underline),
+            ))
+        paragraphs.append(paragraph_spec(text_bytes.decode("utf-8"), tuple(runs)))
+    return tuple(paragraphs)
+
+
+# Function to list the repo-relative paths of every template to pack
+def template_paths(root=TEMPLATE_DIR):
+    paths = sorted(name for name in os.listdir(root) if name.endswith(".docx"))
+    for folder in TEMPLATE_FOLDERS:
+        directory = os.path.join(root, folder)
+        if os.path.isdir(directory):
+            paths.extend(f"{folder}/{name}" for name in sorted(os.listdir(directory)) if name.endswith(".docx"))
+    return paths
+
+
+# Function to compile every template under `root` into a bundle at `path`
+# (written to a temp file and renamed, so running apps keep their old map)
+def build_bundle(root=TEMPLATE_DIR, path=BUNDLE_PATH):
+    from docx import Document
+
+    entries = []
+    records = {}
+    for name in template_paths(root):
+        with open(os.path.join(root, name), "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).digest()
+        if digest not in records:
+            records[digest] = encode_record(compile_document(Document(BytesIO(data))))
+        entries.append((name.encode("utf-8"), digest))
+
+    table_size = sum(_U16.size + len(name) + _ENTRY.size for name, _ in entries)
+    offset = _HEADER.size + table_size
+    offsets = {}
+    for digest, record in records.items():
+        offsets[digest] = offset
+        offset += len(record)
+
+    checksum = hashlib.sha256(b"".join(name + digest for name, digest in entries)).digest()
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(entries), checksum)]
+    for name, digest in entries:
+        parts.append(_U16.pack(len(name)) + name + _ENTRY.pack(digest, offsets[digest], len(records[digest])))
+    parts.extend(records.values())
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp_path, path)
+    return len(entries), len(records), offset
+
+
+# A bundle opened read-only with mmap. Opening reads only the header and
+# offset table; each template is decoded from its slice the first time it
+# is asked for, and that one decoded copy is handed out from then on.
+class TemplateBundle:
+    def __init__(self, path=BUNDLE_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, self.checksum = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} template bundle")
+        self._entries = {}
+        self._by_digest = {}
+        offset = _HEADER.size
+        for _ in range(count):
+            (name_length,) = _U16.unpack_from(self._map, offset)
+            offset += _U16.size
+            name = self._map[offset:offset + name_length].decode("utf-8")
+            offset += name_length
+            digest, record_offset, _ = _ENTRY.unpack_from(self._map, offset)
+            offset += _ENTRY.size
+            self._entries[name] = (digest, record_offset)
+            self._by_digest[digest] = record_offset
+        self._decoded = {}
+
+    def names(self):
+        return list(self._entries)
+
+    def digest_of(self, name):
+        entry = self._entries.get(name)
+        return entry[0].hex() if entry else None
+
+    def _record(self, record_offset):
+        paragraphs = self._decoded.get(record_offset)
+        if paragraphs is None:
+            paragraphs = self._decoded.setdefault(record_offset, decode_record(self._map, record_offset))
+        return paragraphs
+
+    # Compiled paragraphs for a repo-relative template path, or None
+    def get(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return self._record(entry[1])
+
+    # Compiled paragraphs for a template with this SHA-256 (hex), or None
+    def get_by_digest(self, digest):
+        record_offset = self._by_digest.get(bytes.fromhex(digest))
+        if record_offset is None:
+            return None
+        return self._record(record_offset)
+
+    def close(self):
+        self._map.close()
+
+
+# Function to open the bundle once per process (None when it was never built)
+@lru_cache(maxsize=1)
+def default_bundle():
+    try:
+        return TemplateBundle(BUNDLE_PATH)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+# Function to look up compiled paragraphs by the SHA-256 (hex) of a
+# template's bytes. Matching by content means a bundle built from another
+# commit can never hand out the wrong text: changed templates just miss.
+def bundled_paragraphs(digest):
+    bundle = default_bundle()
+    if bundle is None:
+        return None
+    return bundle.get_by_digest(digest)
+
+
+# Function to turn downloaded .docx bytes into a template without parsing,
+# when the bundle holds the same bytes; None otherwise
+def bundled_template(data):
+    paragraphs = bundled_paragraphs(hashlib.sha256(data).hexdigest())
+    if paragraphs is None:
+        return None
+    return TemplateRecord(paragraphs)
+
+
+# Function to load every template one way in this (fresh) process and
+# report the wall time and peak resident memory it took
+def _measure(mode, root):
+    import resource
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "per-file":
+        from docx import Document
+        templates = [compile_document(Document(os.path.join(root, name))) for name in template_paths(root)]
+    else:
+        bundle = TemplateBundle(BUNDLE_PATH)
+        templates = [bundle.get(name) for name in bundle.names()]
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    print(json.dumps({
+        "templates": len(templates),
+        "seconds": seconds,
+        "rss_growth_bytes": (rss_after - rss_before) * scale,
+        "peak_rss_bytes": rss_after * scale,
+    }))
+
+
+# Function to compare cold-start loading, per-file .docx versus the bundle,
+# each in a fresh interpreter
+def report(root=TEMPLATE_DIR, out=sys.stdout):
+    results = {}
+    for mode in ("per-file", "bundle"):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "_measure", mode, root], text=True)
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    out.write(f"{'':10s} {'templates':>9s} {'load':>10s} {'RSS growth':>11s} {'peak RSS':>10s}\n")
+    for mode, result in results.items():
+        out.write(
+            f"{mode:10s} {result['templates']:9d} {result['seconds'] * 1000:8.1f} ms "
+            f"{result['rss_growth_bytes'] / 2**20:8.1f} MB {result['peak_rss_bytes'] / 2**20:7.1f} MB\n"
+        )
+    speedup = results["per-file"]["seconds"] / max(results["bundle"]["seconds"], 1e-9)
+    out.write(f"bundle loads {speedup:.0f}x faster; file is {os.path.getsize(BUNDLE_PATH) / 1024:.1f} KB\n")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the packed template bundle.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="pack the templates into one bundle file")
+    build.add_argument("-o", "--output", default=BUNDLE_PATH)
+    build.add_argument("--root", default=TEMPLATE_DIR)
+    measure = commands.add_parser("report", help="compare cold-start loading against per-file .docx")
+    measure.add_argument("--root", default=TEMPLATE_DIR)
+    internal = commands.add_parser("_measure")
+    internal.add_argument("mode", choices=("per-file", "bundle"))
+    internal.add_argument("root")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count, unique, size = build_bundle(args.root, args.output)
+        print(f"{args.output}: {count} templates ({unique} unique), {size / 1024:.1f} KB")
+    elif args.command == "report":
+        if not os.path.exists(BUNDLE_PATH):
+            build_bundle(args.root, BUNDLE_PATH)
+        report(args.root)
+    else:
+        _measure(args.mode, args.root)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
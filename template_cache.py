@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+
+from diagnosis_index import TemplateRecord, compile_document
+from disk_cache import disk_cache
+from fetch_client import fetch_client
+from note_metrics import span
+from template_bundle import bundled_template
+
+# How long a fetched template stays fresh, and how many we keep per process
+TEMPLATE_TTL_SECONDS = 15 * 60
+TEMPLATE_MAX_ENTRIES = 64
+
+
+# Process-wide cache with a time-to-live and least-recently-used eviction.
+# Streamlit reruns the app script on every widget change but imports this
+# module only once, so one instance is shared by every session.
+class TemplateCache:
+    def __init__(self, ttl=TEMPLATE_TTL_SECONDS, max_entries=TEMPLATE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Whether `key` holds a live entry, without counting a hit or miss or
+    # refreshing its place in the LRU order
+    def contains(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] >= time.monotonic()
+
+    # The live value for `key` (None if there is none), likewise without
+    # touching the counts or the LRU order
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            return entry[0]
+
+    # Return the cached value, or build it with loader() and remember it
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+template_cache = TemplateCache()
+
+
+# Function to turn template bytes into a compact TemplateRecord (the
+# .paragraphs interface of a Document): the bundled copy when the bundle has
+# these bytes, otherwise parsed once and compiled, so no Document outlives
+# the call
+def load_template(data):
+    bundled = bundled_template(data)
+    if bundled is not None:
+        return bundled
+    from docx import Document  # only needed for templates the bundle lacks
+
+    with span("template.parse"):
+        return TemplateRecord(compile_document(Document(BytesIO(data))))
+
+
+# Function to download a .docx from a URL and compile it into a TemplateRecord.
+# The bytes go through the on-disk cache shared by all local processes, so
+# an unchanged template costs a 304 (or no request at all) after a restart.
+def fetch_docx(url):
+    # Ensure the URL starts with https:// or http://
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url  # Default to https if not present
+
+    return load_template(disk_cache.fetch(url))
+
+
+# Function to get a compiled template, downloading it only on a cache miss.
+# The returned TemplateRecord is immutable and shared between sessions.
+def get_docx(url):
+    return template_cache.get_or_load(url, lambda: fetch_docx(url))
+
+
+# Function to load many templates into the cache at once: the misses are
+# fetched in parallel over the shared connection pool, so warming N
+# templates costs about one round-trip instead of N
+def warm_templates(urls):
+    missing = [url for url in dict.fromkeys(urls) if template_cache.get(url) is None]
+    if not missing:
+        return 0
+
+    def fetch(url):
+        try:
+            return url, disk_cache.fetch(url)
+        except requests.exceptions.RequestException as e:
+            return url, e
+
+    loaded = 0
+    for url, data in fetch_client.executor().map(fetch, missing):
+        if isinstance(data, Exception):
+            continue
+        template_cache.put(url, load_template(data))
+        loaded += 1
+    return loaded
+
+
+# Function to parse every template already on disk into this process's
+# cache, so a restarted worker serves its first note without the network
+def warm_from_disk():
+    return warm_templates(disk_cache.urls())
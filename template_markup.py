@@ -0,0 +1,139 @@
+# Inline markup for note templates, compiled once into run specs.
+#
+#     [h]PLAN:[/h]          heading (bold + underlined)
+#     [b]...[/b]            bold
+#     [i]...[/i]            italic
+#     [u]...[/u]            underlined
+#     [[                    a literal "["
+#
+# Tags nest; an unclosed tag runs to the end of the text and a stray
+# closing tag is ignored. Anything else in brackets is plain text. A text
+# is parsed the first time it is seen; after that, rendering it is a loop
+# over the cached runs with no string searching.
+#
+# ROS and physical exam templates state their emphasis in markup. A
+# template with no tags anywhere was written before the markup: it is
+# converted by the legacy_* functions, which escape it and apply the old
+# substring rules once, at load time. Text pasted by the user is never
+# parsed as markup; it is always escaped (legacy_heading_markup).
+import re
+from functools import lru_cache
+
+from diagnosis_index import RunSpec
+
+# Texts whose compiled runs are kept per process
+MARKUP_CACHE_SIZE = 4096
+
+_TOKEN = re.compile(r"\[\[|\[(/?)([bhiu])\]")
+_TAG = re.compile(r"(?<!\[)\[/?[bhiu]\]")
+
+# Which run properties each tag turns on: (bold, italic, underline)
+_TAG_STYLES = {"b": (True, False, False), "i": (False, True, False), "u": (False, False, True), "h": (True, False, True)}
+
+
+# Function to escape plain text so none of it reads as markup
+def escape_markup(text):
+    return text.replace("[", "[[")
+
+
+# Function to check whether a text uses any markup tags
+def has_markup(text):
+    return _TAG.search(text) is not None
+
+
+# Function to check whether a template (its paragraph texts) is written in
+# markup; one tagged paragraph is enough, so its other paragraphs are not
+# read as legacy text
+def uses_markup(texts):
+    return any(has_markup(text) for text in texts)
+
+
+# Function to state plain text as a heading
+def heading_markup(text):
+    return "[h]%s[/h]" % escape_markup(text)
+
+
+# Function to compile marked-up text into a tuple of RunSpecs (the same
+# text / bold / italic / underline fields as a NoteRun). Unstyled
+# properties are None, so they fall back to the paragraph's style.
+def markup_runs(text):
+    runs = []
+    depth = {"b": 0, "i": 0, "u": 0, "h": 0}
+    pending = []
+
+    def flush():
+        chunk = "".join(pending)
+        pending.clear()
+        if not chunk:
+            return
+        bold = italic = underline = False
+        for tag, count in depth.items():
+            if count:
+                tag_bold, tag_italic, tag_underline = _TAG_STYLES[tag]
+                bold, italic, underline = bold or tag_bold, italic or tag_italic, underline or tag_underline
+        runs.append(RunSpec(chunk, bold or None, italic or None, underline or None))
+
+    position = 0
+    for match in _TOKEN.finditer(text):
+        pending.append(text[position:match.start()])
+        position = match.end()
+        if match.group() == "[[":
+            pending.append("[")
+            continue
+        closing, tag = match.groups()
+        if closing and not depth[tag]:
+            continue  # stray closing tag
+        flush()
+        depth[tag] += -1 if closing else 1
+    pending.append(text[position:])
+    flush()
+    return tuple(runs)
+
+
+# Function to compile template markup, once per text; text that is only
+# rendered once (a pasted note) should use markup_runs instead
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def parse_markup(text):
+    return markup_runs(text)
+
+
+# Function to convert a ROS template paragraph written before the markup:
+# "OVERNIGHT EVENTS" is a heading wherever it appears, and so is any other
+# piece of the paragraph that mentions "SUBJECTIVE"
+def legacy_ros_markup(text):
+    chunks = text.split("OVERNIGHT EVENTS")
+    parts = []
+    for i, chunk in enumerate(chunks):
+        if i:
+            parts.append("[h]OVERNIGHT EVENTS[/h]")
+        if "SUBJECTIVE" in chunk:
+            parts.append(heading_markup(chunk))
+        else:
+            parts.append(escape_markup(chunk))
+    return "".join(parts)
+
+
+# Function to convert a line of a pasted note: a line starting with one of
+# `headings` is a heading, anything else plain text
+def legacy_heading_markup(line, headings):
+    if line.startswith(headings):
+        return heading_markup(line)
+    return escape_markup(line)
+
+
+# Function to compile a ROS template paragraph to runs, once per text:
+# as markup if its template uses markup, by the legacy rules otherwise
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def compile_ros_paragraph(text, marked_up=False):
+    return markup_runs(text if marked_up else legacy_ros_markup(text))
+
+
+# Function to compile the text of a template, or a paragraph of one, that
+# may use markup: parsed if it has tags, taken as plain text otherwise
+def template_runs(text):
+    return parse_markup(text if has_markup(text) else escape_markup(text))
+
+
+# Function to give runs with no italic setting of their own italic type
+def italic_runs(runs):
+    return tuple(run._replace(italic=True) if run.italic is None else run for run in runs)
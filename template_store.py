@@ -0,0 +1,183 @@
+import hashlib
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from io import BytesIO
+
+from note_metrics import span
+
+# Templates whose text shingles overlap at least this much count as near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+# One parsed template, shared by every name whose file has the same bytes.
+# parse_seconds is the python-docx parse, or None when the paragraphs came
+# from the template bundle and nothing was parsed.
+class Blob:
+    def __init__(self, digest, size, paragraphs, parse_seconds):
+        self.digest = digest
+        self.size = size
+        self.paragraphs = paragraphs
+        self.parse_seconds = parse_seconds
+        self.names = set()
+
+
+# Content-addressed store: template bytes are keyed by SHA-256, parsed once,
+# and any number of template names can alias the same parsed entry.
+# `precompiled(digest)` may supply already-compiled paragraphs (from the
+# template bundle) so matching bytes skip parsing altogether.
+class TemplateStore:
+    def __init__(self, compile_fn, precompiled=None):
+        self.compile_fn = compile_fn
+        self.precompiled = precompiled
+        self._blobs = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self.parse_count = 0
+
+    # Register `name` as the template with raw .docx bytes `data`
+    def add(self, name, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                paragraphs = self.precompiled(digest) if self.precompiled else None
+                parse_seconds = None
+                if paragraphs is None:
+                    from docx import Document  # only needed for templates the bundle lacks
+
+                    start = time.perf_counter()
+                    with span("template.parse"):
+                        paragraphs = self.compile_fn(Document(BytesIO(data)))
+                    parse_seconds = time.perf_counter() - start
+                    self.parse_count += 1
+                blob = Blob(digest, len(data), paragraphs, parse_seconds)
+                self._blobs[digest] = blob
+            self._unlink(name)
+            self._aliases[name] = digest
+            blob.names.add(name)
+        return blob.paragraphs
+
+    def discard(self, name):
+        with self._lock:
+            self._unlink(name)
+
+    # Drop an alias, and its blob once nothing points at it any more
+    def _unlink(self, name):
+        digest = self._aliases.pop(name, None)
+        if digest is None:
+            return
+        blob = self._blobs[digest]
+        blob.names.discard(name)
+        if not blob.names:
+            del self._blobs[digest]
+
+    # Readers take the lock too, so a refresh running in another thread
+    # never leaves them an alias whose blob is already gone
+    def get(self, name):
+        with self._lock:
+            digest = self._aliases.get(name)
+            if digest is None:
+                return None
+            return self._blobs[digest].paragraphs
+
+    def digest_of(self, name):
+        with self._lock:
+            return self._aliases.get(name)
+
+    def names(self):
+        with self._lock:
+            return list(self._aliases)
+
+    # Groups of names that share identical bytes, largest group first
+    def duplicate_groups(self):
+        with self._lock:
+            groups = [sorted(blob.names) for blob in self._blobs.values() if len(blob.names) > 1]
+        return sorted(groups, key=lambda group: (-len(group), group))
+
+    # Pairs of distinct blobs whose text is nearly the same: (similarity, names_a, names_b)
+    def near_duplicates(self, threshold=NEAR_DUPLICATE_THRESHOLD):
+        with self._lock:
+            blobs = {digest: (blob.paragraphs, sorted(blob.names)) for digest, blob in self._blobs.items()}
+        shingles = {digest: _shingles(paragraphs) for digest, (paragraphs, _) in blobs.items()}
+        pairs = []
+        for a, b in itertools.combinations(sorted(shingles), 2):
+            union = shingles[a] | shingles[b]
+            if not union:
+                continue
+            similarity = len(shingles[a] & shingles[b]) / len(union)
+            if similarity >= threshold:
+                pairs.append((similarity, blobs[a][1], blobs[b][1]))
+        return sorted(pairs, key=lambda pair: -pair[0])
+
+    # Bytes held and parse time spent versus parsing every name separately.
+    # Parse time only counts templates this store parsed itself; bundled
+    # ones are counted in "bundled" instead.
+    def savings(self):
+        saved_bytes = 0
+        saved_seconds = 0.0
+        bundled = 0
+        with self._lock:
+            for blob in self._blobs.values():
+                extra = len(blob.names) - 1
+                saved_bytes += extra * blob.size
+                if blob.parse_seconds is None:
+                    bundled += 1
+                else:
+                    saved_seconds += extra * blob.parse_seconds
+            names, blobs = len(self._aliases), len(self._blobs)
+        return {
+            "names": names,
+            "blobs": blobs,
+            "bundled": bundled,
+            "parses_saved": names - blobs,
+            "bytes_saved": saved_bytes,
+            "parse_seconds_saved": saved_seconds,
+        }
+
+
+# Function to split a template's text into 3-word shingles for similarity checks
+def _shingles(paragraphs, width=3):
+    words = re.findall(r"\w+", " ".join(para.text for para in paragraphs).lower())
+    if len(words) < width:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + width]) for i in range(len(words) - width + 1)}
+
+
+# Function to print a duplicate / near-duplicate report for a store
+def print_report(store, out=sys.stdout):
+    groups = store.duplicate_groups()
+    out.write(f"Identical templates ({len(groups)} groups):\n")
+    for group in groups:
+        out.write(f"  {store.digest_of(group[0])[:12]}  {', '.join(group)}\n")
+
+    pairs = store.near_duplicates()
+    out.write(f"\nNear-duplicate templates ({len(pairs)} pairs, >= {NEAR_DUPLICATE_THRESHOLD:.0%} shared text):\n")
+    for similarity, names_a, names_b in pairs:
+        out.write(f"  {similarity:.0%}  {', '.join(names_a)}  ~  {', '.join(names_b)}\n")
+
+    savings = store.savings()
+    out.write(
+        f"\n{savings['names']} templates, {savings['blobs']} unique: "
+        f"{savings['parses_saved']} parses and {savings['bytes_saved'] / 1024:.1f} KB saved "
+        f"({savings['parse_seconds_saved'] * 1000:.1f} ms of python-docx parse time"
+    )
+    if savings["bundled"]:
+        out.write(f"; {savings['bundled']} unique templates came from the bundle and are not timed")
+    out.write(")\n")
+
+
+if __name__ == "__main__":
+    from diagnosis_index import TEMPLATE_DIR, compile_document
+
+    # Without the bundle, so every unique template is parsed and timed
+    directory = sys.argv[1] if len(sys.argv) > 1 else TEMPLATE_DIR
+    report_store = TemplateStore(compile_document)
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.name.endswith(".docx") and entry.is_file():
+            with open(entry.path, "rb") as f:
+                report_store.add(entry.name[:-5], f.read())
+    print_report(report_store)
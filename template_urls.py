@@ -0,0 +1,29 @@
+import os
+
+# Where the templates are served from, and the selectbox label -> template
+# URL tables shared by the apps. Both bases can be pointed at a local
+# stand-in server (see benchmarks/fake_github.py) through the environment.
+TEMPLATE_BRANCH = os.environ.get("S_CHAR_BRANCH", "main")
+RAW_BASE_URL = os.environ.get(
+    "S_CHAR_RAW_BASE_URL", f"https://raw.githubusercontent.com/conkraw/s_char/{TEMPLATE_BRANCH}"
+).rstrip('/')
+API_BASE_URL = os.environ.get(
+    "S_CHAR_API_BASE_URL", "https://api.github.com/repos/conkraw/s_char"
+).rstrip('/')
+
+# Repo-relative paths of the ROS templates
+ros_paths = {
+    "None": "ros/None.docx",
+    "ROS_PARENT": "ros/ros_parent.docx",
+    "ROS_RN": "ros/ros_rn.docx",
+}
+
+# Repo-relative paths of the physical exam templates ("Infant Day 2", ...)
+physical_exam_paths = {
+    f"{age} Day {day}": f"physicalexam/{age}_Physical_Exam_Day{day}.docx"
+    for day in range(7)
+    for age in ("Adolescent", "Infant", "Child", "Chronic")
+}
+
+ros_files = {label: f"{RAW_BASE_URL}/{path}" for label, path in ros_paths.items()}
+physical_exam_files = {label: f"{RAW_BASE_URL}/{path}" for label, path in physical_exam_paths.items()}
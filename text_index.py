@@ -0,0 +1,260 @@
+import bisect
+import hashlib
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import defaultdict, namedtuple
+
+from diagnosis_index import diagnosis_index, format_diagnosis_name
+from note_metrics import span
+from template_urls import physical_exam_files, ros_files
+
+# How many templates search() returns, and snippets shown per template
+SEARCH_LIMIT = 20
+SNIPPETS_PER_HIT = 3
+SNIPPET_CHARS = 160
+
+# How often (seconds) the ROS / physical exam templates are re-synced
+REMOTE_SYNC_SECONDS = 15 * 60
+
+# A posting packs (document number, paragraph number) into one unsigned int
+PARAGRAPH_BITS = 16
+PARAGRAPH_MASK = (1 << PARAGRAPH_BITS) - 1
+MAX_DOCUMENTS = 1 << (32 - PARAGRAPH_BITS)
+
+# One matching template: doc_id is (kind, display name, key or URL);
+# snippets are markdown
+SearchHit = namedtuple("SearchHit", ["doc_id", "score", "snippets"])
+
+
+# Function to split text into lowercase search terms
+def _terms(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+# Function to escape markdown so template text renders literally
+def _escape_markdown(text):
+    return re.sub(r"([\\`*_{}\[\]()#+\-.!|~<>$])", r"\\\1", text)
+
+
+# Function to cut a paragraph down to a snippet around its first match and
+# bold every matching word
+def highlight(text, patterns, width=SNIPPET_CHARS):
+    text = " ".join(text.split())
+    matcher = re.compile(r"\b(?:" + "|".join(patterns) + r")\w*", re.IGNORECASE)
+    first = matcher.search(text)
+    start = 0
+    if first and len(text) > width:
+        start = max(0, min(first.start() - width // 3, len(text) - width))
+    end = min(len(text), start + width)
+    parts = []
+    position = start
+    for match in matcher.finditer(text, start, end):
+        parts.append(_escape_markdown(text[position:match.start()]))
+        parts.append("**" + _escape_markdown(match.group()) + "**")
+        position = match.end()
+    parts.append(_escape_markdown(text[position:end]))
+    return ("…" if start else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+
+# Inverted index from words to the template paragraphs containing them.
+# Postings are packed into array('I') (4 bytes per paragraph hit), words
+# are interned, and diagnosis paragraphs reuse the strings the diagnosis
+# index already holds, so the index adds little beyond the word list. Templates are updated one at a time:
+# only a changed template's postings are rewritten. Document numbers of
+# removed templates are reused, so re-syncing a changed template forever
+# never runs out of them.
+class TextIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._doc_numbers = {}
+        self._docs = {}  # number -> (doc_id, version, paragraphs)
+        self._next_number = 0
+        self._free_numbers = []
+        self._postings = {}
+        self._vocab = None
+        # diagnosis_index.generation as of the last sync_diagnoses
+        self.diagnosis_generation = None
+
+    # Index (or re-index) one template; unchanged versions are skipped
+    def update(self, doc_id, paragraphs, version):
+        with self._lock:
+            number = self._doc_numbers.get(doc_id)
+            if number is not None:
+                if self._docs[number][1] == version:
+                    return False
+                self._remove(number)
+            if self._free_numbers:
+                number = self._free_numbers.pop()
+            elif self._next_number < MAX_DOCUMENTS:
+                number = self._next_number
+                self._next_number += 1
+            else:
+                raise ValueError(f"text index is full ({MAX_DOCUMENTS} templates)")
+            self._doc_numbers[doc_id] = number
+            paragraphs = tuple(paragraphs)[:PARAGRAPH_MASK + 1]
+            self._docs[number] = (doc_id, version, paragraphs)
+            new_terms = defaultdict(list)
+            for i, text in enumerate(paragraphs):
+                for term in set(_terms(text)):
+                    new_terms[term].append((number << PARAGRAPH_BITS) | i)
+            for term, postings in new_terms.items():
+                existing = self._postings.get(term)
+                if existing is None:
+                    self._postings[sys.intern(term)] = array("I", postings)
+                    self._vocab = None
+                else:
+                    existing.extend(postings)
+            return True
+
+    def remove(self, doc_id):
+        with self._lock:
+            number = self._doc_numbers.get(doc_id)
+            if number is not None:
+                self._remove(number)
+
+    def _remove(self, number):
+        doc_id, _, paragraphs = self._docs.pop(number)
+        del self._doc_numbers[doc_id]
+        self._free_numbers.append(number)
+        for term in {term for text in paragraphs for term in _terms(text)}:
+            postings = self._postings[term]
+            kept = array("I", (p for p in postings if p >> PARAGRAPH_BITS != number))
+            if kept:
+                self._postings[term] = kept
+            else:
+                del self._postings[term]
+                self._vocab = None
+
+    def doc_ids(self):
+        return list(self._doc_numbers)
+
+    # Postings for a word, or for every word it prefixes when `prefix`
+    def _lookup(self, term, prefix):
+        if not prefix:
+            return self._postings.get(term, ())
+        if self._vocab is None:
+            self._vocab = sorted(self._postings)
+        vocab = self._vocab
+        found = []
+        for word in vocab[bisect.bisect_left(vocab, term):]:
+            if not word.startswith(term):
+                break
+            found.extend(self._postings[word])
+        return found
+
+    # Templates containing every query word (the last word may be partial),
+    # rarest words weighing most, each with highlighted snippets
+    def search(self, query, limit=SEARCH_LIMIT):
+        terms = _terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            matched_paragraphs = defaultdict(set)
+            for i, term in enumerate(terms):
+                postings = self._lookup(term, prefix=i == len(terms) - 1)
+                per_doc = defaultdict(set)
+                for posting in postings:
+                    per_doc[posting >> PARAGRAPH_BITS].add(posting & PARAGRAPH_MASK)
+                weight = 1.0 / (1 + len(per_doc))
+                term_scores = {number: weight * len(paras) for number, paras in per_doc.items()}
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {number: scores[number] + s for number, s in term_scores.items() if number in scores}
+                for number in scores:
+                    matched_paragraphs[number] |= per_doc[number]
+                if not scores:
+                    return []
+            ranked = sorted(scores, key=lambda number: -scores[number])[:limit]
+            docs = [self._docs[number] for number in ranked]
+
+        patterns = [re.escape(term) for term in terms]
+        hits = []
+        for number, (doc_id, _, paragraphs) in zip(ranked, docs):
+            snippets = [highlight(paragraphs[i], patterns) for i in sorted(matched_paragraphs[number])[:SNIPPETS_PER_HIT]]
+            hits.append(SearchHit(doc_id, scores[number], snippets))
+        return hits
+
+    # Size of the index itself (terms, posting arrays, lookup tables),
+    # leaving out the paragraph text kept for snippets
+    def stats(self):
+        with self._lock:
+            posting_bytes = sum(postings.buffer_info()[1] * postings.itemsize for postings in self._postings.values())
+            table_bytes = sys.getsizeof(self._postings) + sum(sys.getsizeof(term) for term in self._postings)
+            return {
+                "templates": len(self._docs),
+                "terms": len(self._postings),
+                "postings": sum(len(postings) for postings in self._postings.values()),
+                "bytes": posting_bytes + table_bytes + sys.getsizeof(self._docs) + sys.getsizeof(self._doc_numbers),
+            }
+
+
+text_index = TextIndex()
+_remote_synced_at = None
+_remote_sync_lock = threading.Lock()
+
+
+# Function to (re)index the diagnosis templates. Nothing is done while the
+# diagnosis index is at the generation last synced; otherwise unchanged
+# templates cost a dictionary lookup since the content digest is the version
+def sync_diagnoses(index=text_index):
+    diagnosis_index.ensure_fresh()
+    generation = diagnosis_index.generation
+    if index.diagnosis_generation == generation:
+        return
+    keys = set(diagnosis_index.keys())
+    for doc_id in index.doc_ids():
+        if doc_id[0] == "Diagnosis" and doc_id[2] not in keys:
+            index.remove(doc_id)
+    for key in keys:
+        paragraphs = diagnosis_index.get(key)
+        if paragraphs is not None:
+            doc_id = ("Diagnosis", format_diagnosis_name(key), key)
+            index.update(doc_id, (para.text for para in paragraphs), diagnosis_index.store.digest_of(key))
+    index.diagnosis_generation = generation
+
+
+# Function to (re)index the ROS and physical exam templates, downloading
+# them in parallel through the template caches
+def sync_remote_templates(index=text_index):
+    from template_cache import get_docx, warm_templates
+
+    tables = (("ROS", ros_files), ("Physical exam", physical_exam_files))
+    warm_templates(url for _, files in tables for url in files.values())
+    for kind, files in tables:
+        for label, url in files.items():
+            try:
+                doc = get_docx(url)
+            except Exception:
+                continue  # keep the previous version indexed
+            texts = [para.text for para in doc.paragraphs]
+            version = hashlib.sha256("\n".join(texts).encode()).hexdigest()
+            index.update((kind, label, url), texts, version)
+
+
+def _sync_remote_in_background(index):
+    global _remote_synced_at
+    try:
+        with span("text_index.sync"):
+            sync_remote_templates(index)
+    except Exception:
+        pass  # offline or shutting down: retry on a later warm-up
+    finally:
+        _remote_synced_at = time.monotonic()
+        _remote_sync_lock.release()
+
+
+# Warm-up: index the local diagnosis templates now and the ROS / physical
+# exam templates on a background thread (at most every REMOTE_SYNC_SECONDS),
+# so the first page render never waits on the network
+def warm_text_index(index=text_index):
+    with span("text_index.sync"):
+        sync_diagnoses(index)
+    if _remote_synced_at is not None and time.monotonic() - _remote_synced_at < REMOTE_SYNC_SECONDS:
+        return
+    if _remote_sync_lock.acquire(blocking=False):
+        threading.Thread(target=_sync_remote_in_background, args=(index,), daemon=True).start()
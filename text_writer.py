@@ -0,0 +1,77 @@
+# Plain-text and Markdown writers for the same note paragraphs the docx
+# writers take (see note_builder.py), for clinicians who paste the note
+# into the EHR. No docx package is built and python-docx is never imported.
+#
+# The plain text is exactly the text of the .docx: paragraph by paragraph,
+# joined with newlines, as python-docx reads it back (see
+# benchmarks/check_text_parity.py).
+import re
+
+from docx_writer import Fragment
+from note_metrics import span
+from template_cache import TemplateCache
+
+# Rendered fragments kept per process, as for the fast docx writer
+FRAGMENT_TTL_SECONDS = 60 * 60
+FRAGMENT_MAX_ENTRIES = 512
+
+text_fragment_cache = TemplateCache(ttl=FRAGMENT_TTL_SECONDS, max_entries=FRAGMENT_MAX_ENTRIES)
+
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]<>#|~])")
+
+
+# Function to escape text so Markdown shows it literally
+def _escape_markdown(text):
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+
+# Function to render a run as Markdown: bold (headings) as **...**, italic
+# as *...*, with surrounding spaces kept outside the markers
+def _run_markdown(note_run):
+    text = _escape_markdown(note_run.text)
+    marker = ("**" if note_run.bold else "") + ("*" if note_run.italic else "")
+    if not marker or not text.strip():
+        return text
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    return leading + marker + text.strip() + marker[::-1] + trailing
+
+
+def _paragraph_text(para):
+    return "".join(note_run.text for note_run in para.runs)
+
+
+# Function to render a paragraph as Markdown; line breaks inside it become
+# hard breaks, and the blank line between paragraphs is added by the caller.
+# Leading tabs (diagnosis plans) and spaces are dropped, since they would
+# otherwise start a code block.
+def _paragraph_markdown(para):
+    return "".join(_run_markdown(note_run) for note_run in para.runs).lstrip(" \t").replace("\n", "  \n")
+
+
+# Function to render a note item's lines, reusing a fragment's cached text
+def _item_lines(item, render_paragraph, kind):
+    if not isinstance(item, Fragment):
+        return [render_paragraph(item)]
+    key = (kind,) + tuple(item.key)
+    cached = text_fragment_cache.get(key)
+    if cached is not None and cached[0] is item.source:
+        return cached[1]
+    lines = [render_paragraph(para) for para in item.build()]
+    text_fragment_cache.put(key, (item.source, lines))
+    return lines
+
+
+# Function to render note paragraphs (and fragments) as plain text, one
+# line per paragraph
+def render_text(paragraphs):
+    with span("serialize.text"):
+        return "\n".join(line for item in paragraphs for line in _item_lines(item, _paragraph_text, "text"))
+
+
+# Function to render note paragraphs (and fragments) as Markdown
+def render_markdown(paragraphs):
+    with span("serialize.markdown"):
+        lines = [line for item in paragraphs for line in _item_lines(item, _paragraph_markdown, "markdown")]
+        # Markdown has no empty paragraphs: blank ones are left out
+        return "\n\n".join(line for line in lines if line.strip())
@@ -0,0 +1,179 @@
+# Once-per-process warm-up and the cold-start profile.
+#
+# The apps call warm_up() at the top of every rerun; only the first call in
+# a process does anything. It builds the diagnosis catalog (from the
+# template bundle, so no .docx parsing) and preloads the ROS / physical exam
+# templates on a background thread, so the first user's rerun renders
+# without waiting on the network.
+#
+# Run before starting Streamlit to build the template bundle (if missing)
+# and fill the shared disk cache, so even the first process comes up warm:
+#
+#     python warmup.py
+#
+# Profile a cold start (imports / template loading / first render) in a
+# fresh interpreter:
+#
+#     python warmup.py --profile [appy.py] [-o startup.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from note_metrics import span, stage_timings
+
+# When this module was first imported: the apps import it first, so the
+# time until warm_up() is the app's own import time
+IMPORTED_AT = time.perf_counter()
+
+# Seconds spent in each startup step of this process: imports, catalog,
+# templates, first_render
+startup_profile = {}
+
+_warm_lock = threading.Lock()
+_warm_started = False
+_templates_ready = threading.Event()
+
+
+# Function to record one startup step, both in startup_profile and as a
+# "startup.<step>" stage for the timings panel and Prometheus export
+def _record(step, seconds):
+    startup_profile[step] = seconds
+    stage_timings.record(f"startup.{step}", seconds)
+
+
+# Function to preload every ROS / physical exam template: first whatever the
+# shared disk cache already holds, then the rest in parallel
+def preload_templates():
+    from template_cache import warm_from_disk, warm_templates
+    from template_urls import physical_exam_files, ros_files
+
+    start = time.perf_counter()
+    try:
+        warm_from_disk()
+        warm_templates(list(ros_files.values()) + list(physical_exam_files.values()))
+    except Exception:
+        pass  # offline: templates are fetched on demand instead
+    finally:
+        _record("templates", time.perf_counter() - start)
+        _templates_ready.set()
+
+
+# Function to warm this process once: the diagnosis catalog now (cheap,
+# local) and the remote templates in the background unless `background`
+# is False. Later calls return immediately.
+def warm_up(background=True):
+    global _warm_started
+    with _warm_lock:
+        if _warm_started:
+            return
+        _warm_started = True
+        _record("imports", time.perf_counter() - IMPORTED_AT)
+
+    from diagnosis_catalog import diagnosis_catalog
+
+    with span("startup.catalog"):
+        start = time.perf_counter()
+        diagnosis_catalog.ensure_fresh()
+        startup_profile["catalog"] = time.perf_counter() - start
+
+    if background:
+        threading.Thread(target=preload_templates, name="warm-up", daemon=True).start()
+    else:
+        preload_templates()
+
+
+# Function to wait (up to `timeout` seconds) for the background preload
+def wait_for_templates(timeout=None):
+    return _templates_ready.wait(timeout)
+
+
+# Function called at the end of each rerun: the first finished rerun of the
+# process is its time to first interactive render
+def record_first_render(trace):
+    if "first_render" not in startup_profile and trace.total is not None:
+        _record("first_render", trace.total)
+
+
+# Function to import `module` and time it (0 if something earlier already did)
+def _timed_import(module):
+    start = time.perf_counter()
+    __import__(module)
+    return time.perf_counter() - start
+
+
+# Function to profile one cold start of `app` in this (fresh) interpreter
+def _profile_here(app):
+    profile = {"imports": {}}
+    for module in ("streamlit", "requests", "lxml.etree", "docx", "note_builder", "diagnosis_catalog", "template_cache", "text_index"):
+        profile["imports"][module] = _timed_import(module)
+
+    start = time.perf_counter()
+    warm_up(background=False)
+    profile["warm_up"] = {"catalog": startup_profile["catalog"], "templates": startup_profile["templates"]}
+    profile["warm_up_total"] = time.perf_counter() - start
+
+    from streamlit.testing.v1 import AppTest
+
+    for run in ("first_render", "second_render"):
+        start = time.perf_counter()
+        AppTest.from_file(app, default_timeout=60).run()
+        profile[run] = time.perf_counter() - start
+    return profile
+
+
+# Function to profile a cold start of `app` in a fresh interpreter
+def profile_cold_start(app="appy.py", env=None):
+    root = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--profile-here", app],
+        cwd=root, env=env, text=True, stderr=subprocess.DEVNULL,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Function to print a cold-start profile
+def print_profile(profile, out=sys.stdout):
+    out.write("imports\n")
+    for module, seconds in profile["imports"].items():
+        out.write(f"  {module:20s} {seconds * 1000:8.1f} ms\n")
+    out.write("warm-up\n")
+    for step, seconds in profile["warm_up"].items():
+        out.write(f"  {step:20s} {seconds * 1000:8.1f} ms\n")
+    out.write(f"first render           {profile['first_render'] * 1000:8.1f} ms\n")
+    out.write(f"second render          {profile['second_render'] * 1000:8.1f} ms\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the shared template caches, or profile a cold start.")
+    parser.add_argument("--profile", nargs="?", const="appy.py", default=None, metavar="APP")
+    parser.add_argument("--profile-here", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("-o", "--output", default=None, help="write the profile as JSON here")
+    args = parser.parse_args(argv)
+
+    if args.profile_here:
+        print(json.dumps(_profile_here(args.profile_here)))
+        return 0
+    if args.profile:
+        profile = profile_cold_start(args.profile)
+        print_profile(profile)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(profile, f, indent=2)
+        return 0
+
+    from template_bundle import BUNDLE_PATH, build_bundle
+
+    if not os.path.exists(BUNDLE_PATH):
+        build_bundle()
+    warm_up(background=False)
+    for step, seconds in startup_profile.items():
+        print(f"{step:12s} {seconds * 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())